@@ -0,0 +1,103 @@
+"""
+Moves cold orders out of orders and order_product.
+
+Almost every request touches recent orders, so older ones are moved in
+batches to orders_archive and order_product_archive (compressed pages on
+MySQL), keeping the hot tables and their indexes small enough to stay in
+the buffer pool:
+
+    flask --app script archive-orders                    - older than ORDER_ARCHIVE_AFTER_DAYS
+    flask --app script archive-orders --before 2025-01-01
+
+Each batch copies the orders, their summary as it stands and their lines
+with the product prices of the moment, then deletes the originals (the foreign keys cascade to the lines and
+order_summary rows) in one transaction, so an order is always in exactly
+one place. Orders keep their id: GET /orders/<id> and
+GET /orders/<id>/total fall back to the archive, and
+GET /users/<id>/orders?archived=1 lists it. Archived orders are
+read-only; their stock is never put back.
+
+Why not partition orders by order_date: MySQL requires the partitioning
+column in every unique key, primary key included, and InnoDB doesn't
+support foreign keys on partitioned tables, which the cascades rely on.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+from models import db, ArchivedOrder, ArchivedOrderProduct, Order, OrderProduct, Product
+from order_summary import COLUMNS, summary_select
+
+DEFAULT_AFTER_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+
+# order_summary's columns as named in orders_archive
+ORDER_COLUMNS = ["id", *COLUMNS[1:], "version", "updated_at"]
+
+
+def cutoff(days):
+    """The order_date before which orders are archived, `days` ago (naive UTC)."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now - timedelta(days=days)
+
+
+def archive_orders(before, batch_size=DEFAULT_BATCH_SIZE, limit=None):
+    """
+    Move orders placed before `before`, oldest first, `batch_size` per
+    transaction, and at most `limit` of them. Returns how many moved.
+    """
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        # Locked until the commit: line changes to these orders wait, then
+        # find them gone
+        order_ids = (
+            db.session.execute(
+                select(Order.id)
+                .where(Order.order_date < before)
+                .order_by(Order.order_date, Order.id)
+                .limit(size)
+                .with_for_update()
+            )
+            .scalars()
+            .all()
+        )
+        if not order_ids:
+            break
+        archive_batch(order_ids)
+        db.session.commit()
+        moved += len(order_ids)
+        if len(order_ids) < size:
+            break
+    return moved
+
+
+def archive_batch(order_ids):
+    """Copy the orders and their lines to the archive and delete them, uncommitted."""
+    db.session.execute(
+        insert(ArchivedOrder).from_select(
+            ORDER_COLUMNS,
+            summary_select()
+            .add_columns(Order.version, Order.updated_at)
+            .group_by(Order.version, Order.updated_at)
+            .where(Order.id.in_(order_ids)),
+        )
+    )
+    db.session.execute(
+        insert(ArchivedOrderProduct).from_select(
+            ["order_id", "product_id", "quantity", "unit_price"],
+            select(
+                OrderProduct.order_id,
+                OrderProduct.product_id,
+                OrderProduct.quantity,
+                Product.price,
+            )
+            .join(Product, OrderProduct.product_id == Product.id)
+            .where(OrderProduct.order_id.in_(order_ids)),
+        )
+    )
+    db.session.execute(
+        delete(Order)
+        .where(Order.id.in_(order_ids))
+        .execution_options(synchronize_session=False)
+    )
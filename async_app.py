@@ -0,0 +1,237 @@
+"""
+Async execution mode: the hot read and order-creation handlers on an
+asyncio event loop with SQLAlchemy's AsyncSession, so one worker keeps
+many requests in flight while they wait on the database. Only these
+routes, everything else (updates, deletes, line edits, reports, search,
+bulk) is served by the sync app:
+
+    POST /users, GET /users, GET /users/<id>
+    POST /products, GET /products, GET /products/<id>
+    POST /users/<id>/orders, GET /orders, GET /orders/<id>
+
+Needs Quart and an async driver, which the sync app doesn't:
+    pip install -r requirements-async.txt
+
+    hypercorn "async_app:create_async_app()" --bind 0.0.0.0:5000
+
+Requests and responses match the sync routes: the same marshmallow
+schemas load and dump, and the same checkout.place_order creates orders,
+through AsyncSession.run_sync, which runs them (and any lazy load they
+trigger) against a sync Session view of the async connection.
+"""
+from quart import Quart, g, jsonify, request
+from marshmallow import ValidationError
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from cache import product_cache
+from checkout import place_order
+from config import Config, database_uri, engine_options
+from inventory import OutOfStock
+from loaders import loader_options
+from models import ArchivedOrder, Order, Product, User
+from pagination import page_args
+from routes.users import EMAIL_TAKEN
+from schemas import (
+    OrderSchema,
+    ProductSchema,
+    UserSchema,
+    order_schema,
+    orders_schema,
+    product_schema,
+    products_schema,
+    user_schema,
+    users_schema,
+)
+
+# Sync driver -> async driver for the same database
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_uri(config):
+    """ASYNC_DATABASE_URL, or SQLALCHEMY_DATABASE_URI with an async driver."""
+    if config.get("ASYNC_DATABASE_URL"):
+        return config["ASYNC_DATABASE_URL"]
+    url = make_url(database_uri(config))
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def async_engine_options(config):
+    # Async engines use AsyncAdaptedQueuePool, keep the sizing from DB_*
+    options = dict(engine_options(config))
+    options.pop("poolclass", None)
+    return options
+
+
+def create_async_app(config=Config):
+    app = Quart(__name__)
+    app.config.from_object(config)
+    app.config.from_envvar("ECOMMERCE_SETTINGS", silent=True)
+
+    engine = create_async_engine(
+        async_database_uri(app.config), **async_engine_options(app.config)
+    )
+    # expire_on_commit=False: attributes stay readable after commit
+    # without an implicit (and, in async, illegal) refresh
+    app.extensions["async_session"] = async_sessionmaker(engine, expire_on_commit=False)
+    app.extensions["async_engine"] = engine
+    product_cache.init_app(app)
+
+    @app.before_request
+    async def open_session():
+        g.session = app.extensions["async_session"]()
+
+    @app.teardown_request
+    async def close_session(exc):
+        session = g.pop("session", None)
+        if session is not None:
+            await session.close()
+
+    @app.after_serving
+    async def dispose_engine():
+        await engine.dispose()
+
+    register_routes(app)
+    return app
+
+
+async def load(schema, data, **kwargs):
+    """schema.load() against the request's session."""
+    return await g.session.run_sync(
+        lambda session: schema.load(data, session=session, **kwargs)
+    )
+
+
+async def dump(schema, obj):
+    return await g.session.run_sync(lambda session: schema.dump(obj))
+
+
+async def get_order(order_id, model=Order):
+    stmt = (
+        select(model)
+        .where(model.id == order_id)
+        .options(*loader_options(order_schema, model))
+    )
+    return (await g.session.execute(stmt)).scalar_one_or_none()
+
+
+async def paginate(stmt, key, schema):
+    """Keyset page in the same {"items", "next_cursor"} shape as pagination.paginate."""
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as err:
+        return jsonify({"message": str(err)}), 400
+
+    stmt = stmt.where(key > after).order_by(key).limit(limit + 1)
+    rows = (await g.session.execute(stmt)).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], key.key)
+
+    return jsonify({"items": await dump(schema, rows), "next_cursor": next_cursor}), 200
+
+
+def register_routes(app):
+    # Fresh schema instances for loads: load(session=...) stores the
+    # session on the schema, which must not outlive the request
+
+    @app.route("/users", methods=["POST"])
+    async def create_user():
+        try:
+            user = await load(UserSchema(exclude=("orders",)), await request.get_json())
+        except ValidationError as e:
+            return jsonify(e.messages), 400
+
+        g.session.add(user)
+        try:
+            await g.session.commit()
+        except IntegrityError:
+            await g.session.rollback()
+            return jsonify(EMAIL_TAKEN), 400
+        return jsonify(await dump(user_schema, user)), 201
+
+    @app.route("/users", methods=["GET"])
+    async def get_users():
+        stmt = select(User).options(*loader_options(users_schema))
+        return await paginate(stmt, User.id, users_schema)
+
+    @app.route("/users/<int:user_id>", methods=["GET"])
+    async def get_user(user_id):
+        user = await g.session.get(User, user_id, options=loader_options(user_schema))
+        if not user:
+            return jsonify({"message": "Invalid user id"}), 404
+        return jsonify(await dump(user_schema, user)), 200
+
+    @app.route("/products", methods=["POST"])
+    async def create_product():
+        try:
+            product = await load(ProductSchema(), await request.get_json())
+        except ValidationError as e:
+            return jsonify({"errors": e.messages}), 400
+
+        g.session.add(product)
+        await g.session.commit()
+        product_cache.invalidate()
+        return jsonify(await dump(product_schema, product)), 201
+
+    @app.route("/products", methods=["GET"])
+    async def get_products():
+        return await paginate(select(Product), Product.id, products_schema)
+
+    @app.route("/products/<int:product_id>", methods=["GET"])
+    async def get_product(product_id):
+        product = await g.session.run_sync(product_cache.get_product, product_id)
+        if not product:
+            return jsonify({"message": "Invalid product id"}), 404
+        return jsonify(await dump(product_schema, product)), 200
+
+    @app.route("/users/<int:user_id>/orders", methods=["POST"])
+    async def create_order_with_product(user_id):
+        user = await g.session.get(User, user_id)
+        if not user:
+            return jsonify({"message": "Invalid user id"}), 400
+
+        try:
+            order_data = await load(
+                OrderSchema(), {"user_id": user_id, **(await request.get_json())}
+            )
+        except ValidationError as err:
+            return jsonify(err.messages), 400
+
+        try:
+            new_order, changed = await g.session.run_sync(
+                lambda session: place_order(user, order_data.order_products, session)
+            )
+        except OutOfStock as e:
+            await g.session.rollback()
+            return jsonify({"message": str(e), "shortages": e.shortages}), 409
+        await g.session.commit()
+        for product_id in changed:
+            product_cache.invalidate(product_id)
+
+        # Reload from the database like the sync route, not the identity map
+        g.session.expunge_all()
+        return jsonify(await dump(order_schema, await get_order(new_order.id))), 201
+
+    @app.route("/orders", methods=["GET"])
+    async def get_orders():
+        stmt = select(Order).options(*loader_options(orders_schema))
+        return await paginate(stmt, Order.id, orders_schema)
+
+    @app.route("/orders/<int:order_id>", methods=["GET"])
+    async def get_order_route(order_id):
+        # Falls back to the archive like the sync route
+        order = await get_order(order_id) or await get_order(order_id, ArchivedOrder)
+        if not order:
+            return jsonify({"message": "Invalid order id"}), 400
+        return jsonify(await dump(order_schema, order)), 200
+
+
+if __name__ == "__main__":
+    create_async_app().run(debug=True)
@@ -0,0 +1,85 @@
+"""
+POST /orders/bulk against one POST /users/<id>/orders per order.
+
+    python benchmarks/bench_bulk.py --orders 2000 --batch-sizes 1 10 100 500
+
+Creates the same --orders orders once through single creates and once
+per batch size through one bulk request (?batch_size=, the orders per
+transaction), each on freshly seeded data, and prints orders/s and
+statements per order. Single creates pay a request, a transaction and
+the order's reload per order; bulk inserts each batch with a few
+executemany statements.
+"""
+import argparse
+import os
+import random
+import time
+
+from common import make_app, seed
+
+from diagnostics import count_queries
+
+
+def payload(orders, users, products, lines, rng):
+    return [
+        {
+            "user_id": rng.randint(1, users),
+            "products": [
+                {"product_id": product_id, "quantity": rng.randint(1, 5)}
+                for product_id in rng.sample(range(1, products + 1), lines)
+            ],
+        }
+        for _ in range(orders)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--database", default="/tmp/bench_bulk.db")
+    args = parser.parse_args()
+
+    users, products = 100, 200
+    orders = payload(args.orders, users, products, args.lines, random.Random(42))
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    # A file, so every transaction pays its commit
+    app = make_app(f"sqlite:///{args.database}", REQUEST_LOG=False)
+    client = app.test_client()
+
+    def single():
+        for order in orders:
+            response = client.post(
+                f"/users/{order['user_id']}/orders", json={"products": order["products"]}
+            )
+            assert response.status_code == 201, response.get_json()
+
+    def bulk(batch_size):
+        def send():
+            response = client.post(f"/orders/bulk?batch_size={batch_size}", json=orders)
+            assert response.status_code == 201, response.get_json()
+
+        return send
+
+    runs = [("single creates", single)] + [
+        (f"bulk, batch_size {size}", bulk(size)) for size in args.batch_sizes
+    ]
+    print(f"{'':24} {'orders/s':>9} {'ms/order':>9} {'queries/order':>14}")
+    for name, run in runs:
+        with app.app_context():
+            seed(users=users, products=products, orders=1, lines=1)
+        with app.app_context(), count_queries() as queries:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        print(
+            f"{name:24} {args.orders / elapsed:9.0f} {elapsed * 1000 / args.orders:9.3f} "
+            f"{queries.count / args.orders:14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cost of deleting a user as their order history grows.
+
+    python benchmarks/bench_delete.py --sizes 100 1000 10000 --lines 5
+
+For each size a fresh database gets one user with that many orders and
+deletes them three ways, reporting the time and statement count:
+
+    hydrated  what the ORM cascade used to do: put the stock back, load
+              every order and line into the session, then DELETE them row
+              by row
+    cascade   DELETE /users/<id>?mode=sync, the foreign keys' ON DELETE
+              CASCADE removes the orders, lines and summaries
+    async     DELETE /users/<id>?mode=async, then the purge_user job runs
+              until the queue is empty (JOB_PURGE_BATCH_SIZE orders a run)
+"""
+import argparse
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+from common import make_app, seed
+
+from diagnostics import count_queries
+from inventory import restock_orders
+from jobs import run_pending
+from models import db, Job, Order, OrderProduct, User
+
+
+def hydrated_delete(client, user_id):
+    restock_orders(select(Order.id).where(Order.user_id == user_id))
+    user = db.session.execute(
+        select(User)
+        .where(User.id == user_id)
+        .options(selectinload(User.orders).selectinload(Order.order_products))
+    ).scalar_one()
+    for order in user.orders:
+        for line in order.order_products:
+            db.session.delete(line)
+        db.session.delete(order)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def cascade_delete(client, user_id):
+    assert client.delete(f"/users/{user_id}?mode=sync").status_code == 200
+
+
+def async_delete(client, user_id):
+    assert client.delete(f"/users/{user_id}?mode=async").status_code == 202
+    while run_pending():
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--database-uri", default="sqlite://")
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri, REQUEST_LOG=False)
+    client = app.test_client()
+    modes = [
+        ("hydrated", hydrated_delete),
+        ("cascade", cascade_delete),
+        ("async", async_delete),
+    ]
+
+    # Every mode puts back the stock first: one UPDATE per product ordered
+    print(f"{'orders':>7} {'mode':<9} {'ms':>10} {'queries':>8}")
+    for size in args.sizes:
+        for name, delete_user in modes:
+            with app.app_context():
+                seed(users=1, products=max(args.lines, 50), orders=size, lines=args.lines)
+                db.session.remove()
+                with count_queries() as queries:
+                    start = time.perf_counter()
+                    delete_user(client, 1)
+                    seconds = time.perf_counter() - start
+                left = [
+                    db.session.scalar(select(func.count()).select_from(model))
+                    for model in (User, Order, OrderProduct, Job)
+                ]
+                assert left == [0, 0, 0, 0], f"{name} left rows behind: {left}"
+            print(f"{size:7} {name:<9} {seconds * 1000:10.2f} {queries.count:8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Encode time and bytes on the wire for orders_schema dumps.
+
+    python benchmarks/bench_json.py --orders 5000 --lines 5
+
+Dumps --orders orders (and one page of pagination.MAX_LIMIT) with
+orders_schema, then times building the jsonify response body with the
+stdlib and orjson providers (their outputs must decode to the same data)
+and compressing it with every available Content-Encoding at the default
+levels. Finally fetches GET /orders?limit=MAX_LIMIT through the test
+client with each Accept-Encoding and reports the response size.
+"""
+import argparse
+import json
+
+from sqlalchemy import select
+
+from common import make_app, seed, timed
+
+from compress import DEFAULT_LEVELS, ENCODERS
+from json_provider import OrjsonProvider, StdlibProvider, orjson
+from loaders import loader_options
+from models import db, Order
+from pagination import MAX_LIMIT
+from schemas import orders_schema
+
+
+def dump_orders(limit):
+    stmt = (
+        select(Order).options(*loader_options(orders_schema)).order_by(Order.id).limit(limit)
+    )
+    return orders_schema.dump(db.session.execute(stmt).scalars().all())
+
+
+def report_encoding(app, label, payload, repeat):
+    providers = [("stdlib", StdlibProvider(app))]
+    if orjson is not None:
+        providers.append(("orjson", OrjsonProvider(app)))
+
+    print(f"{label}: {len(payload)} orders")
+    body = None
+    baseline = None
+    for name, provider in providers:
+        # What jsonify does: the response body
+        seconds, encoded = timed(lambda: provider.response(payload).get_data(), repeat)
+        assert json.loads(encoded) == payload, f"{name} output differs"
+        baseline = baseline or seconds
+        body = body or encoded
+        print(
+            f"  encode {name:<7} {seconds * 1000:>9.2f} ms  "
+            f"{len(encoded):>10,} bytes  x{baseline / seconds:.1f}"
+        )
+
+    for encoding, compress in ENCODERS.items():
+        level = DEFAULT_LEVELS[encoding]
+        seconds, compressed = timed(lambda: compress(body, level), repeat)
+        print(
+            f"  {encoding:<4} level {level}  {seconds * 1000:>9.2f} ms  "
+            f"{len(compressed):>10,} bytes  {len(compressed) / len(body):>6.1%} of identity"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app(REQUEST_LOG=False)
+    with app.app_context():
+        seed(args.users, args.products, args.orders, args.lines)
+        report_encoding(app, "all orders", dump_orders(args.orders), args.repeat)
+        report_encoding(app, "one page", dump_orders(MAX_LIMIT), args.repeat)
+
+    print(f"GET /orders?limit={MAX_LIMIT} with JSON_PROVIDER {type(app.json).__name__}")
+    client = app.test_client()
+    for encoding in ["identity", *ENCODERS]:
+        response = client.get(
+            f"/orders?limit={MAX_LIMIT}", headers={"Accept-Encoding": encoding}
+        )
+        print(
+            f"  Accept-Encoding {encoding:<9} {response.status_code}  "
+            f"Content-Encoding {response.headers.get('Content-Encoding', '-'):<5} "
+            f"{len(response.get_data()):>10,} bytes"
+        )
+
+
+if __name__ == "__main__":
+    main()
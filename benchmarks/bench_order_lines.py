@@ -0,0 +1,86 @@
+"""
+Cost of changing one line of an order as the order grows.
+
+    python benchmarks/bench_order_lines.py --sizes 10 100 1000 10000
+
+For each order size this times PUT (upsert one line), DELETE (remove one
+line) and PATCH (10 changes) through the test client and counts their
+statements. Both should stay flat: no route loads the order's lines.
+"""
+import argparse
+
+from sqlalchemy import delete, insert
+
+from common import make_app, seed, timed
+
+from diagnostics import count_queries
+from models import db, OrderProduct
+
+
+def fill_orders(sizes):
+    """Give order i (1-based) sizes[i - 1] lines."""
+    db.session.execute(delete(OrderProduct))
+    db.session.execute(
+        insert(OrderProduct),
+        [
+            {"order_id": order_id, "product_id": product_id, "quantity": 1}
+            for order_id, size in enumerate(sizes, start=1)
+            for product_id in range(1, size + 1)
+        ],
+    )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--database-uri", default="sqlite://")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+    client = app.test_client()
+    largest = max(args.sizes)
+
+    with app.app_context():
+        seed(users=10, products=largest + 10, orders=len(args.sizes), lines=1)
+        fill_orders(args.sizes)
+
+    print(f"{'lines':>7} {'PUT ms':>8} {'DELETE ms':>10} {'PATCH ms':>9} {'queries':>8}")
+    for order_id, size in enumerate(args.sizes, start=1):
+        url = f"/orders/{order_id}/products"
+        # A product past the end of the order, so PUT inserts and DELETE removes it
+        extra = size + 1
+        patch = {
+            "products": [{"product_id": p, "quantity": 2} for p in range(1, 6)]
+            + [{"product_id": p, "quantity": 0} for p in range(6, 11)]
+        }
+
+        def put():
+            return client.put(url, json={"product_id": extra, "quantity": 3})
+
+        def remove():
+            return client.delete(url, json={"product_id": extra})
+
+        def put_and_remove():
+            assert put().status_code == 200
+            assert remove().status_code == 200
+
+        def apply_patch():
+            assert client.patch(url, json=patch).status_code == 200
+
+        put_ms = timed(lambda: put().status_code, args.repeat)[0]
+        both_ms = timed(put_and_remove, args.repeat)[0]
+        patch_ms = timed(apply_patch, args.repeat)[0]
+
+        with app.app_context(), count_queries() as queries:
+            put_and_remove()
+
+        print(
+            f"{size:7} {put_ms * 1000:8.2f} {(both_ms - put_ms) * 1000:10.2f} "
+            f"{patch_ms * 1000:9.2f} {queries.count // 2:8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Latency of GET /products/search on a large catalog.
+
+    python benchmarks/bench_search.py --products 1000000 --queries 2000
+
+Seeds products named from a random vocabulary, then reports p50/p95/p99
+of the in-process index alone and of the full request through the test
+client (index lookup, one SELECT ... WHERE id IN (...), serialization).
+Pass --database-uri for MySQL to measure the FULLTEXT path instead.
+"""
+import argparse
+import random
+import string
+import time
+
+from sqlalchemy import insert
+
+from common import make_app
+
+from models import db, Product
+from search import product_search, tokenize
+
+
+def vocabulary(rng, size):
+    return [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+        for _ in range(size)
+    ]
+
+
+def seed_products(rng, words, count, batch=50_000):
+    db.drop_all()
+    db.create_all()
+    for start in range(0, count, batch):
+        db.session.execute(
+            insert(Product),
+            [
+                {
+                    "product_name": " ".join(rng.sample(words, rng.randint(2, 4))).title(),
+                    "price": round(rng.uniform(1, 500), 2),
+                }
+                for _ in range(min(batch, count - start))
+            ],
+        )
+    db.session.commit()
+
+
+def queries(rng, words, count):
+    result = []
+    for _ in range(count):
+        terms = [rng.choice(words)[: rng.randint(2, 5)] for _ in range(rng.randint(1, 2))]
+        query = {"q": " ".join(terms)}
+        if rng.random() < 0.3:
+            low = rng.uniform(1, 400)
+            query.update(min_price=round(low, 2), max_price=round(low + 100, 2))
+        result.append(query)
+    return result
+
+
+def percentiles(name, samples):
+    samples = sorted(samples)
+
+    def at(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+    print(f"{name:10} p50 {at(0.50):7.2f} ms   p95 {at(0.95):7.2f} ms   p99 {at(0.99):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-uri", default="sqlite://")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = vocabulary(rng, args.words)
+    app = make_app(args.database_uri)
+    client = app.test_client()
+    workload = queries(rng, words, args.queries)
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed_products(rng, words, args.products)
+        print(f"seeded {args.products:,} products in {time.perf_counter() - start:.1f}s")
+
+        fulltext = product_search.uses_fulltext()
+        if not fulltext:
+            start = time.perf_counter()
+            product_search.statement(["warmup"])  # builds the index
+            print(f"built index in {time.perf_counter() - start:.1f}s")
+
+            index = product_search.index
+            samples = []
+            for query in workload:
+                start = time.perf_counter()
+                index.search(
+                    tokenize(query["q"]),
+                    query.get("min_price"),
+                    query.get("max_price"),
+                    limit=args.limit + 1,
+                )
+                samples.append(time.perf_counter() - start)
+            percentiles("index", samples)
+
+    samples = []
+    for query in workload:
+        start = time.perf_counter()
+        response = client.get("/products/search", query_string={**query, "limit": args.limit})
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.json
+    percentiles("fulltext" if fulltext else "request", samples)
+
+
+if __name__ == "__main__":
+    main()
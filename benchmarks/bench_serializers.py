@@ -0,0 +1,65 @@
+"""
+Compare marshmallow dumping with the compiled Core-row serializers.
+
+    python benchmarks/bench_serializers.py --orders 5000 --lines 5
+
+Every schema is dumped both ways and the outputs must be identical before
+any timing is reported.
+"""
+import argparse
+
+from sqlalchemy import select
+
+from common import make_app, seed, timed
+
+from loaders import loader_options
+from models import db, Order, Product, User
+from schemas import orders_schema, products_schema, users_schema
+from serializers import compile_schema
+
+
+def marshmallow_dump(model, schema):
+    stmt = select(model).options(*loader_options(schema)).order_by(model.id)
+    rows = db.session.execute(stmt).scalars().all()
+    result = schema.dump(rows)
+    db.session.expunge_all()
+    return result
+
+
+def fast_dump(model, schema):
+    return compile_schema(schema).dump(db.session, order_by=[model.id])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        seed(args.users, args.products, args.orders, args.lines)
+
+        for name, model, schema in (
+            ("orders", Order, orders_schema),
+            ("products", Product, products_schema),
+            ("users", User, users_schema),
+        ):
+            slow_time, expected = timed(lambda: marshmallow_dump(model, schema), args.repeat)
+            fast_time, actual = timed(lambda: fast_dump(model, schema), args.repeat)
+            assert actual == expected, f"{name}: fast serializer output differs"
+
+            rows = len(expected)
+            print(
+                f"{name:<9} {rows:>7} rows  "
+                f"marshmallow {rows / slow_time:>10,.0f} rows/s  "
+                f"fast {rows / fast_time:>10,.0f} rows/s  "
+                f"x{slow_time / fast_time:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
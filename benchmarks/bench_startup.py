@@ -0,0 +1,109 @@
+"""
+Cold-start cost of the app: import, create_app() and the first request,
+each measured in a fresh interpreter.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --importtime 15
+
+Lazy (the default) defers importing routes and schemas to the first
+request; preload (PRELOAD_BLUEPRINTS=1) pays for them in create_app().
+--importtime N also prints the N slowest modules from python -X importtime.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter, prints the timings as JSON
+PROBE = """
+import json, time
+start = time.perf_counter()
+from script import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get("/health")
+assert response.status_code == 200, response.data
+done = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_request": done - created,
+    "total": done - start,
+}))
+"""
+
+
+def child_env(preload):
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env["PRELOAD_BLUEPRINTS"] = "1" if preload else "0"
+    env["PYTHONPATH"] = ROOT
+    return env
+
+
+def probe(preload):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=child_env(preload),
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def import_profile(top):
+    """The `top` modules with the highest self time during startup."""
+    code = "from script import create_app; create_app()"
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=child_env(preload=False),
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), module.strip()))
+    rows.sort(reverse=True)
+
+    print(f"\n{'self ms':>8} {'cumul ms':>9}  module")
+    for self_us, cumulative_us, module in rows[:top]:
+        print(f"{self_us / 1000:8.1f} {cumulative_us / 1000:9.1f}  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N")
+    args = parser.parse_args()
+
+    print(f"median of {args.runs} runs, ms")
+    print(f"{'mode':8} {'import':>8} {'create_app':>11} {'1st request':>12} {'total':>8}")
+    for name, preload in (("lazy", False), ("preload", True)):
+        runs = [probe(preload) for _ in range(args.runs)]
+        median = {
+            key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]
+        }
+        print(
+            f"{name:8} {median['import']:8.1f} {median['create_app']:11.1f} "
+            f"{median['first_request']:12.1f} {median['total']:8.1f}"
+        )
+
+    if args.importtime:
+        import_profile(args.importtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Order ids across archiving, against a SQLite file.
+
+    python benchmarks/check_archive.py
+
+Seeds a few orders, archives all of them (the newest included), then
+through the Flask test client checks that a new order gets an id no
+archived order has, that GET /orders/<id> and /reports/order-totals tell
+the new and the archived orders apart, and that archiving again moves
+the new order without colliding. SQLite reuses MAX(id) + 1 unless the
+table is AUTOINCREMENT. Exits 1 if a check fails.
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from common import make_app, seed
+
+import archive
+from models import db, ArchivedOrder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="/tmp/check_archive.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    app = make_app(f"sqlite:///{args.database}", REQUEST_LOG=False)
+    client = app.test_client()
+    failures = []
+
+    def check(condition, message):
+        print(("ok    " if condition else "FAIL  ") + message)
+        if not condition:
+            failures.append(message)
+
+    future = datetime.now() + timedelta(days=1)
+    with app.app_context():
+        seed(users=5, products=20, orders=10, lines=2)
+        moved = archive.archive_orders(future)
+        newest = db.session.execute(db.select(db.func.max(ArchivedOrder.id))).scalar()
+    check(moved == 10, f"archived {moved} orders, the newest is {newest}")
+
+    response = client.post(
+        "/users/1/orders", json={"products": [{"product_id": 1, "quantity": 1}]}
+    )
+    check(response.status_code == 201, f"POST /users/1/orders returned {response.status_code}")
+    order_id = response.get_json()["id"]
+    check(order_id > newest, f"new order got id {order_id}, after archived {newest}")
+
+    fresh = client.get(f"/orders/{order_id}")
+    old = client.get(f"/orders/{newest}")
+    check(
+        [line["product"]["id"] for line in fresh.get_json()["products"]] == [1],
+        f"GET /orders/{order_id} returns the new order's lines",
+    )
+    check(
+        fresh.headers["ETag"] != old.headers["ETag"],
+        f"new and archived orders have their own ETags: {fresh.headers['ETag']}, {old.headers['ETag']}",
+    )
+    ids = Counter(
+        item["order_id"] for item in client.get("/reports/order-totals").get_json()["items"]
+    )
+    check(
+        max(ids.values()) == 1 and len(ids) == 11,
+        f"/reports/order-totals lists 11 distinct orders: {sorted(ids)}",
+    )
+
+    with app.app_context():
+        try:
+            moved = archive.archive_orders(future)
+        except Exception as e:
+            moved = f"{type(e).__name__}: {e}"
+    check(moved == 1, f"archiving again moved the new order: {moved}")
+
+    if failures:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Check that the hot route queries are served by indexes, not full scans.
+
+    python benchmarks/check_indexes.py
+    python benchmarks/check_indexes.py --database-uri mysql+mysqlconnector://...
+
+Each query's plan is printed; the script fails on the first one that
+doesn't use the index it was added for.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from common import make_app, seed
+
+from diagnostics import assert_uses_index
+from models import db, Order, OrderProduct, OrderSummary, Product, User
+
+
+def hot_queries():
+    since = datetime.now() - timedelta(days=30)
+    return [
+        (
+            "user -> orders",
+            select(Order).where(Order.user_id == 1).order_by(Order.order_date),
+            "ix_orders_user_id_order_date",
+        ),
+        (
+            "product -> order lines",
+            select(OrderProduct.order_id, OrderProduct.quantity).where(
+                OrderProduct.product_id == 1
+            ),
+            "ix_order_product_product_order_qty",
+        ),
+        (
+            "orders in a date range",
+            select(Order.id).where(Order.order_date >= since),
+            "ix_orders_order_date",
+        ),
+        (
+            "revenue of one product",
+            select(func.sum(OrderProduct.quantity * Product.price))
+            .join(Product, OrderProduct.product_id == Product.id)
+            .where(OrderProduct.product_id == 1),
+            "ix_order_product_product_order_qty",
+        ),
+        (
+            "user -> order summaries",
+            select(OrderSummary)
+            .where(OrderSummary.user_id == 1, OrderSummary.order_id > 0)
+            .order_by(OrderSummary.order_id),
+            "ix_order_summary_user_id_order_id",
+        ),
+        (
+            "products changed since (search refresh)",
+            select(Product.id, Product.product_name, Product.price).where(
+                Product.updated_at >= since
+            ),
+            "ix_products_updated_at",
+        ),
+        (
+            "user by email",
+            select(User.id).where(User.email == "user1@example.com"),
+            # SQLite names the unique index itself
+            "autoindex_users" if db.engine.dialect.name == "sqlite" else "uq_users_email",
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-uri", default="sqlite://")
+    parser.add_argument("--orders", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+    with app.app_context():
+        seed(users=500, products=1000, orders=args.orders)
+        for name, stmt, index in hot_queries():
+            plan = assert_uses_index(stmt, index)
+            print(f"{name}:")
+            for line in plan:
+                print(f"    {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Statements per request for the list and detail routes.
+
+    python benchmarks/check_queries.py
+
+Sends each GET twice through the Flask test client, once for a few rows
+and once for many (a page of 3 and of 34, an order with 1 line and with
+30, a user with 1 order and with 30), under diagnostics.assert_max_queries.
+Both must run the same number of statements, at most the route's budget:
+an N+1 lazy load shows up as a count growing with the rows. Exits 1 if
+a check fails.
+"""
+import sys
+
+from common import make_app, seed
+
+from diagnostics import assert_max_queries
+from models import db
+
+# (route, budget, path for few rows, path for many)
+ROUTES = [
+    ("GET /orders", 2, "/orders?limit=3", "/orders?limit=34"),
+    ("GET /orders fast", 2, "/orders?limit=3&serializer=fast", "/orders?limit=34&serializer=fast"),
+    ("GET /orders?view=summary", 1, "/orders?view=summary&limit=3", "/orders?view=summary&limit=34"),
+    ("GET /orders/<id>", 3, "/orders/{small_order}", "/orders/{big_order}"),
+    ("GET /users", 1, "/users?limit=3", "/users?limit=34"),
+    ("GET /users/<id>?expand=orders", 3, "/users/{small_user}?expand=orders", "/users/{big_user}?expand=orders"),
+    ("GET /users/<id>/orders", 2, "/users/{big_user}/orders?limit=3", "/users/{big_user}/orders?limit=34"),
+    ("GET /products", 1, "/products?limit=3", "/products?limit=34"),
+]
+
+
+def main():
+    # Cached products would hide the product queries
+    app = make_app(PRODUCT_CACHE_ENABLED=False, REQUEST_LOG=False)
+    client = app.test_client()
+    failures = []
+
+    def check(condition, message):
+        print(("ok    " if condition else "FAIL  ") + message)
+        if not condition:
+            failures.append(message)
+
+    with app.app_context():
+        seed(users=50, products=60, orders=100, lines=3)
+    ids = {}
+    response = client.post(
+        "/users/1/orders",
+        json={"products": [{"product_id": n, "quantity": 1} for n in range(1, 31)]},
+    )
+    ids["big_order"] = response.get_json()["id"]
+    for name, orders in (("small_user", 1), ("big_user", 30)):
+        user = {"name": name, "email": f"{name}@example.com", "address": "1 Query St"}
+        ids[name] = client.post("/users", json=user).get_json()["id"]
+        for _ in range(orders):
+            response = client.post(
+                f"/users/{ids[name]}/orders", json={"products": [{"product_id": 1}]}
+            )
+    ids["small_order"] = response.get_json()["id"]
+
+    for route, budget, few, many in ROUTES:
+        counts = []
+        for path in (few.format(**ids), many.format(**ids)):
+            with app.app_context():
+                try:
+                    with assert_max_queries(budget) as queries:
+                        status = client.get(path).status_code
+                except AssertionError:
+                    status = "over budget"
+            counts.append(queries.count)
+            if status != 200:
+                check(False, f"{path}: {status}")
+        check(
+            counts[0] == counts[1] <= budget,
+            f"{route}: {counts[0]} and {counts[1]} statements, budget {budget}",
+        )
+
+    if failures:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
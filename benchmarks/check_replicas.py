@@ -0,0 +1,164 @@
+"""
+Read/write splitting against SQLite files standing in for a primary and
+its replicas.
+
+    python benchmarks/check_replicas.py
+    python benchmarks/check_replicas.py --replicas 3 --requests 300
+
+Seeds the primary, copies it to every replica file (a replica that is
+up to date), then through the Flask test client checks that:
+
+- GET requests are spread over the replicas and never reach the primary,
+- writes go to the primary, and the writing client reads its new row
+  from the primary while a fresh client doesn't see it on the replicas,
+- a replica whose file becomes unreadable is taken out without failing
+  requests, and comes back once REPLICA_RETRY_AFTER has passed,
+- with every replica down, reads fall back to the primary.
+
+Counts statements per database with cursor events. Exits 1 if a check
+fails.
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+from common import make_app, seed
+
+from models import db
+
+READ_PATHS = ("/products", "/users", "/orders", "/products/1", "/orders/1", "/users/1")
+
+
+def count_statements(app):
+    counts = Counter()
+    with app.app_context():
+        for key, engine in db.engines.items():
+            name = key or "primary"
+            event.listen(
+                engine,
+                "before_cursor_execute",
+                lambda *args, name=name: counts.update([name]),
+            )
+    return counts
+
+
+def read_all(client, requests):
+    statuses = Counter()
+    for i in range(requests):
+        statuses[client.get(READ_PATHS[i % len(READ_PATHS)]).status_code] += 1
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", default="/tmp/check_replicas")
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=120)
+    args = parser.parse_args()
+
+    shutil.rmtree(args.directory, ignore_errors=True)
+    os.makedirs(args.directory)
+    primary = os.path.join(args.directory, "primary.db")
+    replicas = [os.path.join(args.directory, f"replica_{n}.db") for n in range(1, args.replicas + 1)]
+
+    app = make_app(f"sqlite:///{primary}", REQUEST_LOG=False)
+    with app.app_context():
+        seed(users=50, products=100, orders=200, lines=3)
+        db.engine.dispose()
+    for path in replicas:
+        shutil.copy(primary, path)
+
+    app = make_app(
+        f"sqlite:///{primary}",
+        SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{path}" for path in replicas],
+        # The product cache would answer reads without touching a database
+        PRODUCT_CACHE_ENABLED=False,
+        REQUEST_LOG=False,
+        REPLICA_CHECK_INTERVAL=0,
+        REPLICA_RETRY_AFTER=0.5,
+    )
+    counts = count_statements(app)
+    failures = []
+
+    def check(condition, message):
+        print(("ok    " if condition else "FAIL  ") + message)
+        if not condition:
+            failures.append(message)
+
+    # Reads are spread over the replicas
+    statuses = read_all(app.test_client(), args.requests)
+    check(statuses == {200: args.requests}, f"{args.requests} reads answered 200: {dict(statuses)}")
+    check(counts["primary"] == 0, f"primary ran {counts['primary']} statements for reads")
+    used = [counts[f"replica_{n}"] for n in range(1, args.replicas + 1)]
+    check(all(used), f"every replica served reads: {used} statements")
+
+    # A write goes to the primary, and its client reads it back from there
+    counts.clear()
+    writer = app.test_client()
+    response = writer.post("/products", json={"product_name": "Fresh", "price": 9.5})
+    check(response.status_code == 201, f"POST /products returned {response.status_code}")
+    product_id = response.get_json()["id"]
+    check(
+        counts["primary"] > 0 and sum(counts.values()) == counts["primary"],
+        f"write ran on the primary only: {dict(counts)}",
+    )
+    status = writer.get(f"/products/{product_id}").status_code
+    check(status == 200, f"writer reads its new product from the primary: {status}")
+    status = app.test_client().get(f"/products/{product_id}").status_code
+    check(status == 404, f"another client reads a replica without it: {status}")
+
+    # Failover: replica_1 becomes unreadable
+    broken = replicas[0]
+    os.rename(broken, broken + ".away")
+    os.mkdir(broken)
+    with app.app_context():
+        db.engines["replica_1"].dispose()
+    counts.clear()
+    statuses = read_all(app.test_client(), args.requests)
+    check(statuses == {200: args.requests}, f"reads with replica_1 down answered 200: {dict(statuses)}")
+    check(
+        counts["replica_1"] == 0 and counts["primary"] == 0,
+        f"reads avoided replica_1 and the primary: {dict(counts)}",
+    )
+    health = app.test_client().get("/health").get_json()
+    check(
+        [r["healthy"] for r in health["replicas"]][0] is False,
+        f"/health reports replica_1 down: {health['replicas'][0]}",
+    )
+
+    # Recovery once the retry delay has passed
+    os.rmdir(broken)
+    os.rename(broken + ".away", broken)
+    time.sleep(0.6)
+    counts.clear()
+    read_all(app.test_client(), args.requests)
+    check(counts["replica_1"] > 0, f"replica_1 serves reads again: {dict(counts)}")
+
+    # Every replica down: the primary takes the reads
+    for path in replicas:
+        os.rename(path, path + ".away")
+        os.mkdir(path)
+    with app.app_context():
+        for n in range(1, args.replicas + 1):
+            db.engines[f"replica_{n}"].dispose()
+    counts.clear()
+    statuses = read_all(app.test_client(), args.requests)
+    check(statuses == {200: args.requests}, f"reads with no replica answered 200: {dict(statuses)}")
+    check(
+        sum(counts.values()) == counts["primary"] > 0,
+        f"reads fell back to the primary: {dict(counts)}",
+    )
+
+    if failures:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
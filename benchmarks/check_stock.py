@@ -0,0 +1,125 @@
+"""
+Hundreds of parallel orders against a few products with limited stock.
+
+    python benchmarks/check_stock.py --orders 500 --stock 100 --concurrency 50
+    python benchmarks/check_stock.py --database-uri mysql+mysqlconnector://... --hot 3
+
+Runs a threaded WSGI server in its own process and fires --orders
+POST /users/<id>/orders at it, each taking --quantity of every one of
+--hot products (listed in a random order, to provoke lock-order
+deadlocks). Then checks that every order got 201 or 409, that stock never
+went negative and that each product's stock dropped by exactly the units
+on its new order lines. Exits 1 if anything doesn't add up.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select, update
+
+from common import make_app, seed
+from run import HttpDriver, serve, wait_until_up
+
+from models import db, OrderProduct, Product
+
+
+def snapshot(product_ids):
+    stock = dict(
+        db.session.execute(
+            select(Product.id, Product.stock).where(Product.id.in_(product_ids))
+        ).all()
+    )
+    ordered = dict(
+        db.session.execute(
+            select(OrderProduct.product_id, func.sum(OrderProduct.quantity))
+            .where(OrderProduct.product_id.in_(product_ids))
+            .group_by(OrderProduct.product_id)
+        ).all()
+    )
+    return stock, {product_id: ordered.get(product_id, 0) for product_id in product_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-uri", default="sqlite:////tmp/bench_stock.db")
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--hot", type=int, default=2, help="products in every order")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=5071)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    hot = list(range(1, args.hot + 1))
+    app = make_app(args.database_uri)
+    with app.app_context():
+        seed(users=100, products=args.hot + 10, orders=10, lines=2)
+        db.session.execute(update(Product).where(Product.id.in_(hot)).values(stock=args.stock))
+        db.session.commit()
+        stock_before, ordered_before = snapshot(hot)
+        db.engine.dispose()
+
+    server = multiprocessing.Process(
+        target=serve, args=(args.database_uri, args.port), daemon=True
+    )
+    server.start()
+    statuses = Counter()
+    errors = []
+    try:
+        driver = HttpDriver(args.port, args.concurrency)
+        wait_until_up(driver)
+
+        def place_order(_):
+            products = rng.sample(hot, len(hot))
+            status, body = driver.request(
+                "POST",
+                f"/users/{rng.randint(1, 100)}/orders",
+                {"products": [{"product_id": p, "quantity": args.quantity} for p in products]},
+            )
+            statuses[status] += 1
+            if status not in (201, 409):
+                errors.append(f"{status}: {body[:200].decode(errors='replace')}")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(place_order, range(args.orders)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+
+    with app.app_context():
+        stock_after, ordered_after = snapshot(hot)
+
+    print(f"{args.orders} orders in {elapsed:.2f}s, {args.concurrency} in flight")
+    print(f"responses: {json.dumps(dict(sorted(statuses.items())))}")
+    expected_created = min(args.orders, args.stock // args.quantity)
+    failures = list(errors[:5])
+    if statuses[201] != expected_created:
+        failures.append(f"{statuses[201]} orders created, expected {expected_created}")
+    for product_id in hot:
+        taken = stock_before[product_id] - stock_after[product_id]
+        added = ordered_after[product_id] - ordered_before[product_id]
+        print(
+            f"product {product_id}: stock {stock_before[product_id]} -> "
+            f"{stock_after[product_id]}, {added} units on new lines"
+        )
+        if stock_after[product_id] < 0:
+            failures.append(f"product {product_id} stock went negative")
+        if taken != added or added != statuses[201] * args.quantity:
+            failures.append(f"product {product_id}: {taken} units taken, {added} ordered")
+
+    if failures:
+        print("FAILED\n" + "\n".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Writes that race a concurrent change, through the Flask test client.
+
+    python benchmarks/check_writes.py
+
+Each check sends one write and, just before its versioned UPDATE is
+flushed, changes the same row in the same transaction the way a
+concurrent request would (a sale taking stock, a line change bumping the
+order), so the race is the same on every run. Checks that:
+
+- PUT /products/<id> with If-Match and a new price answers 412 and
+  leaves the price and the order totals as they were,
+- the same PUT without If-Match runs again and succeeds, with the order
+  totals repriced,
+- PUT and PATCH /orders/<id>/products without If-Match succeed, and with
+  If-Match answer 412,
+- a 412 sent under an Idempotency-Key isn't replayed: retrying with the
+  key and a fresh If-Match succeeds,
+- a sale committed while PUT /products/<id> sets the stock still comes
+  off the new stock.
+
+Exits 1 if a check fails.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import event, select, update
+
+from common import make_app, seed
+
+from inventory import adjust
+from models import db, Order, OrderProduct, OrderSummary, Product
+from order_summary import rebuild
+
+
+def concurrently(change):
+    """Run change(session) right before the next flush, once."""
+    event.listen(db.session, "before_flush", lambda session, *args: change(session), once=True)
+
+
+def sell(product_id):
+    return lambda session: adjust({product_id: 1}, session)
+
+
+def before_update(change):
+    """Run change() right before the next ORM UPDATE statement, once."""
+    pending = [change]
+
+    @event.listens_for(db.session, "do_orm_execute")
+    def run(state):
+        if state.is_update and pending:
+            pending.pop()()
+
+
+def committed_sale(product_id):
+    # Another request's sale, committed on its own connection
+    def sell():
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Product)
+                .where(Product.id == product_id)
+                .values(stock=Product.stock - 1, version=Product.version + 1)
+            )
+
+    return sell
+
+
+def edit_order(order_id):
+    # What another line change does to the order
+    return lambda session: session.execute(
+        update(Order)
+        .where(Order.id == order_id)
+        .values(version=Order.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="/tmp/check_writes.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    # Cached rows would hide what the database holds
+    app = make_app(f"sqlite:///{args.database}", PRODUCT_CACHE_ENABLED=False, REQUEST_LOG=False)
+    client = app.test_client()
+    failures = []
+
+    def check(condition, message):
+        print(("ok    " if condition else "FAIL  ") + message)
+        if not condition:
+            failures.append(message)
+
+    def product_state(product_id):
+        with app.app_context():
+            price = db.session.get(Product, product_id).price
+            totals = db.session.execute(
+                select(OrderSummary.total)
+                .join(OrderProduct, OrderProduct.order_id == OrderSummary.order_id)
+                .where(OrderProduct.product_id == product_id)
+                .order_by(OrderSummary.order_id)
+            ).scalars().all()
+            return price, totals
+
+    with app.app_context():
+        seed(users=10, products=20, orders=50, lines=3)
+        db.session.execute(update(Product).values(stock=1000))
+        db.session.commit()
+
+    # A price change racing a sale, with If-Match
+    with app.app_context():
+        product_id = db.session.execute(select(OrderProduct.product_id)).scalars().first()
+    before = product_state(product_id)
+    etag = client.get(f"/products/{product_id}").headers["ETag"]
+    with app.app_context():
+        concurrently(sell(product_id))
+        response = client.put(
+            f"/products/{product_id}",
+            json={"price": before[0] + 1},
+            headers={"If-Match": etag},
+        )
+    check(
+        response.status_code == 412,
+        f"PUT /products/{product_id} with If-Match racing a sale: {response.status_code}",
+    )
+    check(
+        product_state(product_id) == before,
+        "price and order totals unchanged after the 412",
+    )
+
+    # The same change without If-Match
+    with app.app_context():
+        concurrently(sell(product_id))
+        response = client.put(f"/products/{product_id}", json={"price": before[0] + 1})
+    check(
+        response.status_code == 200,
+        f"PUT /products/{product_id} without If-Match racing a sale: {response.status_code}",
+    )
+    price, _ = product_state(product_id)
+    with app.app_context():
+        _, repaired = rebuild()
+    check(
+        price == before[0] + 1 and repaired == 0,
+        f"new price {price} and order totals repriced ({repaired} summaries off)",
+    )
+
+    # Line changes racing another line change of the same order
+    with app.app_context():
+        order_id = db.session.execute(select(Order.id)).scalars().first()
+    line = {"product_id": 20, "quantity": 2}
+    for method, body in (("PUT", line), ("PATCH", {"products": [line]})):
+        with app.app_context():
+            concurrently(edit_order(order_id))
+            response = client.open(f"/orders/{order_id}/products", method=method, json=body)
+        check(
+            response.status_code == 200,
+            f"{method} /orders/{order_id}/products without If-Match racing an edit: "
+            f"{response.status_code}",
+        )
+        etag = client.get(f"/orders/{order_id}").headers["ETag"]
+        with app.app_context():
+            concurrently(edit_order(order_id))
+            response = client.open(
+                f"/orders/{order_id}/products",
+                method=method,
+                json=body,
+                headers={"If-Match": etag},
+            )
+        check(
+            response.status_code == 412,
+            f"{method} /orders/{order_id}/products with If-Match racing an edit: "
+            f"{response.status_code}",
+        )
+
+    # Idempotency keys don't keep conflicts
+    key = {"Idempotency-Key": "check-writes-412"}
+    stale = {"If-Match": client.get(f"/orders/{order_id}").headers["ETag"], **key}
+    client.put(f"/orders/{order_id}/products", json={"product_id": 19, "quantity": 1})
+    response = client.put(f"/orders/{order_id}/products", json=line, headers=stale)
+    etag = client.get(f"/orders/{order_id}").headers["ETag"]
+    retry = client.put(
+        f"/orders/{order_id}/products", json=line, headers={"If-Match": etag, **key}
+    )
+    check(
+        (response.status_code, retry.status_code) == (412, 200)
+        and "Idempotent-Replayed" not in retry.headers,
+        f"412 under an Idempotency-Key, then a retry with it: {retry.status_code}",
+    )
+
+    # Setting the stock while a sale commits
+    with app.app_context():
+        before_update(committed_sale(product_id))
+        response = client.put(f"/products/{product_id}", json={"stock": 500})
+        stock = db.session.get(Product, product_id).stock
+    check(
+        response.status_code == 200 and stock == 499,
+        f"PUT /products/{product_id} stock 500 racing a committed sale: "
+        f"{response.status_code}, stock {stock}",
+    )
+
+    if failures:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
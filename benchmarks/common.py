@@ -0,0 +1,70 @@
+"""Shared setup for the benchmark scripts: a throwaway app and seed data."""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from models import db, Order, OrderProduct, OrderSummary, Product, User
+from order_summary import COLUMNS, summary_select
+from script import create_app
+
+
+def make_app(database_uri="sqlite://", **config):
+    # Routes are loaded up front so benchmarks can use the schemas directly
+    return create_app(
+        {"SQLALCHEMY_DATABASE_URI": database_uri, "PRELOAD_BLUEPRINTS": True, **config}
+    )
+
+
+def seed(users=100, products=200, orders=1000, lines=5, seed=42):
+    """
+    Fill an empty database with Core executemany inserts. Each order gets
+    `lines` distinct random products. Must run inside an app context.
+    """
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(
+        insert(User),
+        [
+            {"name": f"User {i}", "email": f"user{i}@example.com", "address": f"{i} Main St"}
+            for i in range(1, users + 1)
+        ],
+    )
+    db.session.execute(
+        insert(Product),
+        [
+            {"product_name": f"Product {i}", "price": round(rng.uniform(1, 500), 2)}
+            for i in range(1, products + 1)
+        ],
+    )
+    db.session.execute(
+        insert(Order),
+        [{"user_id": rng.randint(1, users)} for _ in range(orders)],
+    )
+    db.session.execute(
+        insert(OrderProduct),
+        [
+            {"order_id": order_id, "product_id": product_id, "quantity": rng.randint(1, 5)}
+            for order_id in range(1, orders + 1)
+            for product_id in rng.sample(range(1, products + 1), min(lines, products))
+        ],
+    )
+    db.session.execute(insert(OrderSummary).from_select(COLUMNS, summary_select()))
+    db.session.commit()
+
+
+def timed(fn, repeat=5):
+    """Best wall time of `repeat` runs of fn(), and its last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
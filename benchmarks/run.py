@@ -0,0 +1,492 @@
+"""
+Load test of every endpoint, saved as JSON so runs can be compared.
+
+    python benchmarks/run.py --output results/before.json
+    python benchmarks/run.py --compare results/before.json --output results/after.json
+
+Seeds the database (--users, --products, --orders, --lines), then sends
+--requests requests to each endpoint, once through the Flask test client
+and once over HTTP to a threaded WSGI server in its own process, with
+--concurrency clients in flight. The database is re-seeded before each
+driver, and every request is generated from --seed, so two runs send the
+same requests. Prints throughput and p50/p95/p99 per endpoint.
+
+--compare flags every endpoint whose p95 grew, or whose throughput fell,
+by more than --threshold against the saved run, and exits with status 1
+if there is one. Only compare runs from the same machine, database and
+volumes: the saved "meta" block records them and differences are printed.
+Tail latencies of short runs are noisy, raise --requests before lowering
+--threshold.
+"""
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy.engine import make_url
+
+from common import make_app, seed
+
+from models import db
+
+HOST = "127.0.0.1"
+
+# build(rng, state, volumes) returns (path, json body or None). Ids a
+# request creates are appended to state[creates] for later scenarios.
+Scenario = namedtuple("Scenario", "name method build ok creates", defaults=((200,), None))
+
+
+def pick(rng, volumes, kind):
+    return rng.randint(1, volumes[kind])
+
+
+def pop(state, key):
+    ids = state.get(key)
+    return ids.pop() if ids else None
+
+
+def order_lines(rng, volumes, count):
+    return [
+        {"product_id": product_id, "quantity": rng.randint(1, 5)}
+        for product_id in rng.sample(range(1, volumes["products"] + 1), count)
+    ]
+
+
+def new_user(rng, state, volumes):
+    number = state["next_user"] = state.get("next_user", 0) + 1
+    return "/users", {
+        "name": f"Bench User {number}",
+        "email": f"bench{number}@example.com",
+        "address": f"{number} Load Test Ave",
+    }
+
+
+def put_line(rng, state, volumes):
+    order_id, product_id = pick(rng, volumes, "orders"), pick(rng, volumes, "products")
+    # Lines the DELETE scenario removes again
+    state.setdefault("lines", []).append((order_id, product_id))
+    return f"/orders/{order_id}/products", {"product_id": product_id, "quantity": 2}
+
+
+def delete_line(rng, state, volumes):
+    line = pop(state, "lines")
+    if line is None:
+        return None
+    return f"/orders/{line[0]}/products", {"product_id": line[1]}
+
+
+def delete_created(path, key):
+    def build(rng, state, volumes):
+        created = pop(state, key)
+        return None if created is None else (path.format(created), None)
+
+    return build
+
+
+# Reads first, then writes, then deletes of rows the writes created
+SCENARIOS = [
+    Scenario("GET /users", "GET", lambda r, s, v: ("/users?limit=50", None)),
+    Scenario("GET /users/<id>", "GET", lambda r, s, v: (f"/users/{pick(r, v, 'users')}", None)),
+    Scenario("GET /products", "GET", lambda r, s, v: ("/products?limit=50", None)),
+    Scenario(
+        "GET /products/<id>",
+        "GET",
+        lambda r, s, v: (f"/products/{pick(r, v, 'products')}", None),
+    ),
+    Scenario(
+        "GET /products/search",
+        "GET",
+        lambda r, s, v: (f"/products/search?q=product+{pick(r, v, 'products')}", None),
+    ),
+    Scenario("GET /products/cache", "GET", lambda r, s, v: ("/products/cache", None)),
+    Scenario("GET /orders", "GET", lambda r, s, v: ("/orders?limit=50", None)),
+    Scenario(
+        "GET /orders?fields=",
+        "GET",
+        lambda r, s, v: ("/orders?limit=50&fields=id,order_date,user.name", None),
+    ),
+    Scenario(
+        "GET /orders?view=summary",
+        "GET",
+        lambda r, s, v: ("/orders?view=summary&limit=50", None),
+    ),
+    Scenario(
+        "GET /users/<id>/orders",
+        "GET",
+        lambda r, s, v: (f"/users/{pick(r, v, 'users')}/orders", None),
+    ),
+    Scenario(
+        "GET /orders/<id>", "GET", lambda r, s, v: (f"/orders/{pick(r, v, 'orders')}", None)
+    ),
+    Scenario(
+        "GET /orders/<id>/total",
+        "GET",
+        lambda r, s, v: (f"/orders/{pick(r, v, 'orders')}/total", None),
+    ),
+    Scenario(
+        "GET /reports/order-totals", "GET", lambda r, s, v: ("/reports/order-totals", None)
+    ),
+    Scenario(
+        "GET /reports/product-revenue",
+        "GET",
+        lambda r, s, v: ("/reports/product-revenue?limit=20", None),
+    ),
+    Scenario(
+        "GET /reports/top-customers",
+        "GET",
+        lambda r, s, v: ("/reports/top-customers?limit=20", None),
+    ),
+    Scenario("GET /metrics", "GET", lambda r, s, v: ("/metrics", None)),
+    Scenario("GET /metrics/requests", "GET", lambda r, s, v: ("/metrics/requests", None)),
+    Scenario("GET /health", "GET", lambda r, s, v: ("/health", None)),
+    Scenario("POST /users", "POST", new_user, ok=(201,), creates="users"),
+    Scenario(
+        "PUT /users/<id>",
+        "PUT",
+        lambda r, s, v: (
+            f"/users/{pick(r, v, 'users')}",
+            {"address": f"{r.randint(1, 999)} Elm St"},
+        ),
+        # Concurrent writes to the same row lose the version check
+        ok=(200, 412),
+    ),
+    Scenario(
+        "POST /products",
+        "POST",
+        lambda r, s, v: ("/products", {"product_name": "Bench Product", "price": 9.99}),
+        ok=(201,),
+        creates="products",
+    ),
+    Scenario(
+        "PUT /products/<id>",
+        "PUT",
+        lambda r, s, v: (
+            f"/products/{pick(r, v, 'products')}",
+            {"price": round(r.uniform(1, 500), 2)},
+        ),
+        ok=(200, 412),
+    ),
+    Scenario(
+        "POST /users/<id>/orders",
+        "POST",
+        lambda r, s, v: (
+            f"/users/{pick(r, v, 'users')}/orders",
+            {"products": order_lines(r, v, min(v["lines"], v["products"]))},
+        ),
+        ok=(201,),
+        creates="orders",
+    ),
+    Scenario(
+        "POST /orders/bulk",
+        "POST",
+        lambda r, s, v: (
+            "/orders/bulk",
+            [
+                {"user_id": pick(r, v, "users"), "products": order_lines(r, v, 2)}
+                for _ in range(10)
+            ],
+        ),
+        ok=(201,),
+    ),
+    Scenario("PUT /orders/<id>/products", "PUT", put_line),
+    Scenario(
+        "PATCH /orders/<id>/products",
+        "PATCH",
+        lambda r, s, v: (
+            f"/orders/{pick(r, v, 'orders')}/products",
+            {"products": order_lines(r, v, min(3, v["products"]))},
+        ),
+    ),
+    Scenario("DELETE /orders/<id>/products", "DELETE", delete_line),
+    Scenario("DELETE /orders/<id>", "DELETE", delete_created("/orders/{}", "orders")),
+    Scenario("DELETE /products/<id>", "DELETE", delete_created("/products/{}", "products")),
+    Scenario("DELETE /users/<id>", "DELETE", delete_created("/users/{}", "users")),
+]
+
+
+class ClientDriver:
+    """In-process requests through the Flask test client, one at a time."""
+
+    name = "client"
+    concurrency = 1
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    """HTTP/1.0 requests to the WSGI server, a new connection each."""
+
+    name = "wsgi"
+
+    def __init__(self, port, concurrency):
+        self.port = port
+        self.concurrency = concurrency
+
+    def request(self, method, path, body):
+        conn = http.client.HTTPConnection(HOST, self.port, timeout=60)
+        try:
+            headers = {}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def serve(database_uri, port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    # Slow-query warnings would break up the results table
+    app = make_app(database_uri, SLOW_QUERY_MS=60_000)
+    make_server(HOST, port, app, threaded=True, request_handler=QuietHandler).serve_forever()
+
+
+def wait_until_up(driver, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            driver.request("GET", "/health", None)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def percentile(samples, p):
+    # Nearest rank
+    return samples[max(0, math.ceil(len(samples) * p) - 1)]
+
+
+def run_scenario(driver, scenario, count, state, volumes, rng_seed):
+    rng = random.Random(f"{rng_seed}:{scenario.name}")
+    requests = []
+    for _ in range(count):
+        request = scenario.build(rng, state, volumes)
+        if request is None:
+            break
+        requests.append(request)
+
+    latencies = []
+    errors = []
+    created = []
+
+    def send(request):
+        path, body = request
+        start = time.perf_counter()
+        status, data = driver.request(scenario.method, path, body)
+        latencies.append(time.perf_counter() - start)
+        if status not in scenario.ok:
+            errors.append(f"{status} {path}: {data[:200].decode(errors='replace')}")
+        elif scenario.creates:
+            created.append(json.loads(data)["id"])
+
+    start = time.perf_counter()
+    if driver.concurrency == 1:
+        for request in requests:
+            send(request)
+    else:
+        with ThreadPoolExecutor(driver.concurrency) as pool:
+            list(pool.map(send, requests))
+    elapsed = time.perf_counter() - start
+
+    if scenario.creates:
+        state.setdefault(scenario.creates, []).extend(sorted(created))
+    if not latencies:
+        return None
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def run_driver(driver, args, volumes):
+    # Untimed pass over the reads so pools, caches and the search index are warm
+    warm = random.Random(args.seed)
+    for scenario in SCENARIOS:
+        if scenario.method == "GET":
+            for _ in range(args.warmup):
+                driver.request("GET", *scenario.build(warm, {}, volumes))
+
+    results = {}
+    state = {}
+    print(f"\n{driver.name}: {args.requests} requests per endpoint, {driver.concurrency} in flight")
+    print(f"{'endpoint':32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for scenario in SCENARIOS:
+        if args.only and args.only not in scenario.name:
+            continue
+        result = run_scenario(driver, scenario, args.requests, state, volumes, args.seed)
+        if result is None:
+            continue
+        results[scenario.name] = result
+        print(
+            f"{scenario.name:32} {result['rps']:8.0f} {result['p50_ms']:8.2f} "
+            f"{result['p95_ms']:8.2f} {result['p99_ms']:8.2f} {result['errors']:7}"
+        )
+        if result["first_error"]:
+            print(f"    first error: {result['first_error']}")
+    return results
+
+
+def seed_database(args, volumes):
+    app = make_app(args.database_uri)
+    with app.app_context():
+        seed(seed=args.seed, **volumes)
+    return app
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current, threshold):
+    """Print the changes against a saved run; returns the regressions."""
+    for key in ("database", "volumes", "requests", "concurrency", "machine", "python"):
+        if previous["meta"].get(key) != current["meta"].get(key):
+            print(
+                f"warning: {key} differs: {previous['meta'].get(key)} -> "
+                f"{current['meta'].get(key)}"
+            )
+
+    regressions = []
+    print(f"\ncompared with {previous['meta'].get('commit')} ({previous['meta']['started_at']})")
+    print(f"{'endpoint':40} {'p95 ms':>17} {'req/s':>15}")
+    for driver, results in current["results"].items():
+        for name, result in results.items():
+            before = previous["results"].get(driver, {}).get(name)
+            if before is None:
+                continue
+            p95 = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0
+            rps = result["rps"] / before["rps"] - 1 if before["rps"] else 0
+            regressed = p95 > threshold or -rps > threshold
+            if regressed:
+                regressions.append(f"{driver} {name}")
+            print(
+                f"{driver + ' ' + name:40} {before['p95_ms']:7.2f} {p95:+8.1%} "
+                f"{before['rps']:6.0f} {rps:+8.1%}{'  REGRESSION' if regressed else ''}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-uri", default="sqlite:////tmp/bench_run.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--driver", choices=["client", "wsgi", "both"], default="both")
+    parser.add_argument("--only", help="run the endpoints whose name contains this")
+    parser.add_argument("--port", type=int, default=5061)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.20)
+    args = parser.parse_args()
+
+    if args.driver != "client" and make_url(args.database_uri).database in (None, "", ":memory:"):
+        parser.error("the WSGI server needs a database it can share, not in-memory SQLite")
+
+    volumes = {
+        "users": args.users,
+        "products": args.products,
+        "orders": args.orders,
+        "lines": args.lines,
+    }
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "database": make_url(args.database_uri).render_as_string(hide_password=True),
+            "volumes": volumes,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "machine": f"{platform.machine()} {platform.node()} ({os.cpu_count()} cpus)",
+            "python": platform.python_version(),
+        },
+        "results": {},
+    }
+
+    if args.driver in ("client", "both"):
+        app = seed_database(args, volumes)
+        with app.app_context():
+            report["results"]["client"] = run_driver(ClientDriver(app), args, volumes)
+            db.engine.dispose()
+
+    if args.driver in ("wsgi", "both"):
+        app = seed_database(args, volumes)
+        with app.app_context():
+            # No connections shared with the forked server
+            db.engine.dispose()
+        server = multiprocessing.Process(
+            target=serve, args=(args.database_uri, args.port), daemon=True
+        )
+        server.start()
+        try:
+            driver = HttpDriver(args.port, args.concurrency)
+            wait_until_up(driver)
+            report["results"]["wsgi"] = run_driver(driver, args, volumes)
+        finally:
+            server.terminate()
+            server.join()
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nsaved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
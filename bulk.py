@@ -0,0 +1,212 @@
+import json
+from collections import Counter
+from itertools import islice
+
+from marshmallow import ValidationError
+from sqlalchemy import insert, select
+
+from cache import product_cache
+from inventory import reserve
+from jobs import enqueue_many
+from order_summary import summarize_orders
+from models import db, Order, OrderProduct, Product, User
+from schemas import OrderSchema
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def iter_payload(request):
+    """
+    Yield (index, item) for every order in the request body.
+
+    Accepts a JSON array, or NDJSON (Content-Type: application/x-ndjson)
+    which is read line by line so the body is never held in memory at once.
+    A line that isn't valid JSON is yielded as an error dict instead.
+    """
+    if request.mimetype == "application/x-ndjson":
+        index = 0
+        for line in iter(request.stream.readline, b""):
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, {"_error": "Invalid JSON"}
+            index += 1
+        return
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of orders or an NDJSON body")
+    yield from enumerate(items)
+
+
+def ingest(items, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validate and insert orders `batch_size` at a time, one transaction per
+    batch. Returns one result per item:
+    {"index": 0, "status": "created", "order_id": 12}
+    {"index": 1, "status": "error", "errors": {...}}
+    """
+    results = []
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return results
+        results.extend(_ingest_batch(batch))
+
+
+def _ingest_batch(batch):
+    results = {}
+    candidates = []
+
+    for index, item in batch:
+        if not isinstance(item, dict) or "_error" in item:
+            message = item.get("_error") if isinstance(item, dict) else None
+            results[index] = _error(index, {"_schema": [message or "Expected an object"]})
+        else:
+            candidates.append((index, item))
+
+    valid = _validate(candidates, results)
+
+    if valid:
+        try:
+            valid, changed = _allocate(valid, results)
+            order_ids = _insert_orders(valid) if valid else []
+            summarize_orders(order_ids)
+            enqueue_many(
+                "order_confirmation", [{"order_id": order_id} for order_id in order_ids]
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for index, _ in valid:
+                results[index] = _error(index, {"_schema": [str(e)]})
+        else:
+            for product_id in changed:
+                product_cache.invalidate(product_id)
+            for (index, _), order_id in zip(valid, order_ids):
+                results[index] = {"index": index, "status": "created", "order_id": order_id}
+
+    # Drop the validated instances before the next batch
+    db.session.expunge_all()
+    return [results[index] for index, _ in batch]
+
+
+def _validate(candidates, results):
+    """
+    Run OrderSchema(many=True) over the batch and check every user id with
+    one IN query. Returns [(index, {"user_id": .., "lines": [(product_id, quantity)]})].
+    """
+    if not candidates:
+        return []
+
+    try:
+        loaded = OrderSchema(many=True).load([item for _, item in candidates])
+        errors = {}
+    except ValidationError as err:
+        # Nothing is instantiated when any item fails, valid_data holds dicts
+        loaded, errors = err.valid_data, err.messages
+
+    user_ids = {
+        _get(order, "user_id") for pos, order in enumerate(loaded) if pos not in errors
+    }
+    known_users = set()
+    if user_ids:
+        stmt = select(User.id).where(User.id.in_(user_ids))
+        known_users = set(db.session.execute(stmt).scalars())
+
+    valid = []
+    for pos, (index, _) in enumerate(candidates):
+        if pos in errors:
+            results[index] = _error(index, errors[pos])
+            continue
+
+        order = loaded[pos]
+        if _get(order, "user_id") not in known_users:
+            results[index] = _error(index, {"user_id": ["Invalid user id"]})
+            continue
+
+        lines = [(op.product_id, op.quantity) for op in _get(order, "order_products")]
+        valid.append((index, {"user_id": _get(order, "user_id"), "lines": lines}))
+
+    return valid
+
+
+def _allocate(valid, results):
+    """
+    Reject, in input order, the orders the tracked stock can't cover and
+    take the stock of the rest. Stock is read locked and in product id
+    order; reserve()'s conditional UPDATEs still catch a concurrent order
+    on databases without row locks (the batch then fails).
+    Returns (orders to insert, product ids whose stock changed).
+    """
+    product_ids = sorted({product_id for _, order in valid for product_id, _ in order["lines"]})
+    stmt = (
+        select(Product.id, Product.stock)
+        .where(Product.id.in_(product_ids), Product.stock.is_not(None))
+        .order_by(Product.id)
+        .with_for_update()
+    )
+    stock = dict(db.session.execute(stmt).all())
+
+    kept = []
+    for index, order in valid:
+        needed = Counter()
+        for product_id, quantity in order["lines"]:
+            if product_id in stock:
+                needed[product_id] += quantity
+        short = [
+            f"Product id {product_id} has {stock[product_id]} in stock, {units} requested"
+            for product_id, units in sorted(needed.items())
+            if units > stock[product_id]
+        ]
+        if short:
+            results[index] = _error(index, {"products": short})
+            continue
+        for product_id, units in needed.items():
+            stock[product_id] -= units
+        kept.append((index, order))
+
+    changed = reserve([line for _, order in kept for line in order["lines"]])
+    return kept, changed
+
+
+def _insert_orders(valid):
+    """
+    Insert the orders and their lines with executemany statements and
+    return the new order ids in input order.
+    """
+    order_rows = [{"user_id": order["user_id"]} for _, order in valid]
+    dialect = db.session.get_bind().dialect
+
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        stmt = insert(Order).returning(Order.id, sort_by_parameter_order=True)
+        order_ids = db.session.execute(stmt, order_rows).scalars().all()
+    else:
+        # MySQL can't return ids from an executemany, so orders go one row at
+        # a time; the (much larger) order_product insert is still batched.
+        order_ids = [
+            db.session.execute(insert(Order).values(**row)).inserted_primary_key[0]
+            for row in order_rows
+        ]
+
+    line_rows = [
+        {"order_id": order_id, "product_id": product_id, "quantity": quantity}
+        for order_id, (_, order) in zip(order_ids, valid)
+        for product_id, quantity in order["lines"]
+    ]
+    db.session.execute(insert(OrderProduct), line_rows)
+    return order_ids
+
+
+def _get(order, key):
+    # Loaded items are Order instances on success and dicts on failure
+    if isinstance(order, dict):
+        return order.get(key)
+    return getattr(order, key)
+
+
+def _error(index, errors):
+    return {"index": index, "status": "error", "errors": errors}
@@ -0,0 +1,295 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from models import Product
+
+MISSING = object()
+
+
+class CacheBackend:
+    """
+    Interface every cache backend implements. Values are plain Python data;
+    get() returns MISSING rather than None so None can be cached.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        raise NotImplementedError
+
+    def counter(self, key):
+        """Current value of an incr() counter, 0 if unset. Not a hit or miss."""
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class LRUCache(CacheBackend):
+    """In-process cache that drops the least recently used entry when full."""
+
+    def __init__(self, maxsize=10_000, ttl=300, clock=time.monotonic):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                # Expired entries count as evictions too
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            expires_at, value = self._data.get(key, (float("inf"), 0))
+            self._data[key] = (expires_at, value + 1)
+            self._data.move_to_end(key)
+            return value + 1
+
+    def counter(self, key):
+        with self._lock:
+            return self._data.get(key, (None, 0))[1]
+
+    def stats(self):
+        return {**super().stats(), "size": len(self._data), "maxsize": self.maxsize}
+
+
+class SharedCache(CacheBackend):
+    """
+    Cache kept in a shared key-value server so every worker sees the same
+    entries and invalidations. Works with any client exposing
+    get(key), set(key, value, ex=seconds), delete(key) and incr(key),
+    e.g. redis.Redis, or LocalClient for tests and single-node setups.
+    Evictions happen on the server and are not counted here.
+    """
+
+    def __init__(self, client, prefix="ecommerce:", ttl=300):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(
+            self.prefix + key, pickle.dumps(value), ex=self.ttl if ttl is None else ttl
+        )
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return int(self.client.incr(self.prefix + key))
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+
+class LocalClient:
+    """Minimal in-memory stand-in for a Redis client (get/set/delete/incr)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            expires_at = self.clock() + ex if ex else None
+            self._data[key] = (expires_at, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            expires_at, value = self._data.get(key, (None, 0))
+            value = int(value) + 1
+            self._data[key] = (expires_at, value)
+            return value
+
+
+class ProductCache:
+    """
+    Read-through cache for the product catalog.
+
+    Single products are cached as column dicts and re-attached to the
+    session with merge(load=False), so callers get real Product instances
+    without a SELECT. List pages are cached as their JSON payload under a
+    generation number that every product write bumps.
+
+    Config:
+    PRODUCT_CACHE_ENABLED  (default True)
+    PRODUCT_CACHE_TTL      seconds (default 300)
+    PRODUCT_CACHE_SIZE     entries for the in-process LRU (default 10000)
+    PRODUCT_CACHE_CLIENT   a Redis-like client; switches to SharedCache
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def init_app(self, app):
+        app.config.setdefault("PRODUCT_CACHE_ENABLED", True)
+        app.config.setdefault("PRODUCT_CACHE_TTL", 300)
+        app.config.setdefault("PRODUCT_CACHE_SIZE", 10_000)
+        app.config.setdefault("PRODUCT_CACHE_CLIENT", None)
+
+        if not app.config["PRODUCT_CACHE_ENABLED"]:
+            self.backend = None
+        elif app.config["PRODUCT_CACHE_CLIENT"] is not None:
+            self.backend = SharedCache(
+                app.config["PRODUCT_CACHE_CLIENT"], ttl=app.config["PRODUCT_CACHE_TTL"]
+            )
+        else:
+            self.backend = LRUCache(
+                maxsize=app.config["PRODUCT_CACHE_SIZE"],
+                ttl=app.config["PRODUCT_CACHE_TTL"],
+            )
+
+    def get_products(self, session, product_ids):
+        """
+        Return {id: Product} for the ids that exist. Cache misses are
+        fetched together with one WHERE id IN (...) query.
+        """
+        products = {}
+        missing = []
+        for product_id in product_ids:
+            row = MISSING if self.backend is None else self.backend.get(_key(product_id))
+            if row is MISSING:
+                missing.append(product_id)
+            else:
+                products[product_id] = _attach(session, row)
+
+        if missing:
+            stmt = select(Product).where(Product.id.in_(missing))
+            for product in session.execute(stmt).scalars():
+                products[product.id] = product
+                if self.backend is not None:
+                    self.backend.set(_key(product.id), _row(product))
+        return products
+
+    def get_product(self, session, product_id):
+        return self.get_products(session, [product_id]).get(product_id)
+
+    def get_page(self, after, limit, load, variant=""):
+        """
+        Return the cached list page, calling load() to build it on a miss.
+        `variant` tells apart pages dumped with different ?fields=.
+        """
+        if self.backend is None:
+            return load()
+
+        generation = self.backend.counter("products:generation")
+        key = f"products:page:{generation}:{after}:{limit}:{variant}"
+
+        page = self.backend.get(key)
+        if page is MISSING:
+            page = load()
+            self.backend.set(key, page)
+        return page
+
+    def invalidate(self, product_id=None):
+        """
+        Call after committing a product write. Drops the product's entry
+        and retires every cached list page by bumping the generation.
+        """
+        if self.backend is None:
+            return
+        if product_id is not None:
+            self.backend.delete(_key(product_id))
+        self.backend.incr("products:generation")
+
+    def stats(self):
+        if self.backend is None:
+            return {"backend": None}
+        return self.backend.stats()
+
+
+def _key(product_id):
+    return f"products:{product_id}"
+
+
+def _row(product):
+    return {attr.key: getattr(product, attr.key) for attr in inspect(Product).column_attrs}
+
+
+def _attach(session, row):
+    # Prefer the instance the session already holds, it may have pending changes
+    existing = session.identity_map.get(identity_key(Product, row["id"]))
+    if existing is not None:
+        return existing
+
+    product = Product(**row)
+    make_transient_to_detached(product)
+    return session.merge(product, load=False)
+
+
+product_cache = ProductCache()
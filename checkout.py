@@ -0,0 +1,27 @@
+"""
+Placing an order: what POST /users/<id>/orders does in the sync app
+(routes/orders.py) and, through run_sync, in the async one (async_app.py).
+"""
+from inventory import reserve
+from jobs import enqueue
+from models import db, Order
+from order_summary import summarize_orders
+
+
+def place_order(user, order_products, session=None):
+    """
+    Add an order with its lines and take their stock, then write its
+    order_summary row and queue its confirmation in the same transaction.
+    Uncommitted. Returns (order, ids of the products whose stock changed);
+    raises OutOfStock, the caller must then roll back.
+    `session` defaults to db.session.
+    """
+    session = session or db.session
+    order = Order(user=user, order_products=list(order_products))
+    session.add(order)
+    changed = reserve([(op.product_id, op.quantity) for op in order.order_products], session)
+    # The summary row and the confirmation job commit with the order
+    session.flush()
+    summarize_orders([order.id], session)
+    enqueue("order_confirmation", {"order_id": order.id}, session=session)
+    return order, changed
@@ -0,0 +1,121 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+JSON and text responses of at least COMPRESS_MIN_SIZE bytes are
+compressed with the client's preferred encoding among zstd, br and gzip;
+when it rates several the same, the order of COMPRESS_ALGORITHMS decides.
+gzip is always available, br needs `pip install brotli` and zstd
+Python 3.14 or `pip install zstandard`.
+
+Streamed responses (NDJSON) are sent as they are. A compressed body has
+different bytes, so its strong ETag gets the coding as a suffix
+("order-1-v2-...-gzip"); conditional.py accepts either form back in
+If-None-Match and If-Match. Every compressible response, and every 304
+standing in for one, carries Vary: Accept-Encoding so shared caches keep
+the encodings apart.
+"""
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard
+    except ImportError:  # optional
+        zstandard = None
+    zstd = None
+
+MIMETYPES = {"application/json", "text/plain", "text/html", "text/csv"}
+# Fast levels: higher ones cost far more CPU for a few percent smaller bodies
+DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+
+
+def _gzip(data, level):
+    # mtime=0 so the same body always compresses to the same bytes
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    if zstd is not None:
+        return zstd.compress(data, level=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def coded_etag(etag, encoding):
+    """The strong ETag of `etag`'s representation compressed with `encoding`."""
+    return f"{etag}-{encoding}"
+
+
+# Content-Encoding -> compress(data, level), for the installed libraries
+ENCODERS = {"gzip": _gzip}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+if zstd is not None or zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+
+
+class Compression:
+    """
+    after_request hook compressing responses.
+
+    Config:
+    COMPRESS_ENABLED     (default True)
+    COMPRESS_MIN_SIZE    bytes below which bodies are sent as they are (default 500)
+    COMPRESS_ALGORITHMS  server preference (default ["zstd", "br", "gzip"])
+    COMPRESS_LEVELS      per encoding (default DEFAULT_LEVELS)
+    """
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_ENABLED", True)
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_ALGORITHMS", ["zstd", "br", "gzip"])
+        app.config.setdefault("COMPRESS_LEVELS", DEFAULT_LEVELS)
+        if app.config["COMPRESS_ENABLED"]:
+            app.after_request(self.compress)
+
+    def compress(self, response):
+        if response.status_code == 304:
+            # Caches update the stored 200 from the 304's headers, Vary included
+            response.vary.add("Accept-Encoding")
+            return response
+        if (
+            response.mimetype not in MIMETYPES
+            or response.is_streamed
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.status_code in (204, 206)
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        config = current_app.config
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        encoding = request.accept_encodings.best_match(
+            [name for name in config["COMPRESS_ALGORITHMS"] if name in ENCODERS]
+        )
+        if encoding is None:
+            return response
+
+        level = config["COMPRESS_LEVELS"].get(encoding, DEFAULT_LEVELS[encoding])
+        response.set_data(ENCODERS[encoding](data, level))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(coded_etag(etag, encoding))
+        return response
+
+
+compression = Compression()
@@ -0,0 +1,180 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import func, select
+from sqlalchemy.orm.exc import StaleDataError
+
+from compress import DEFAULT_LEVELS, coded_etag
+from models import db, ArchivedOrder, ArchivedOrderProduct, Order, OrderProduct, Product, User
+
+# Extra runs of a write without If-Match that lost a race (see retry_stale)
+STALE_RETRIES = 3
+
+
+def row_etag(obj):
+    """Strong ETag for a versioned row, e.g. product-7-v3."""
+    return f"{type(obj).__name__.lower()}-{obj.id}-v{obj.version}"
+
+
+def order_etag(order_id, archived=False):
+    """
+    ETag for GET /orders/<id> without loading the order. The order's body
+    embeds its user and products, so their versions are folded in: any
+    line change bumps the order version, and versions only ever grow, so
+    the sum of product details_version changes whenever a product's name
+    or price does (stock changes, which the body doesn't show, don't).
+    archived=True reads the archive tables; an order keeps its ETag when
+    it is archived, as its body doesn't change.
+    Returns None when the order doesn't exist.
+    """
+    orders, lines = (ArchivedOrder, ArchivedOrderProduct) if archived else (Order, OrderProduct)
+    stmt = (
+        select(
+            orders.version,
+            User.version,
+            func.count(lines.product_id),
+            func.coalesce(func.sum(Product.details_version), 0),
+        )
+        .join(User, orders.user_id == User.id)
+        .outerjoin(lines, lines.order_id == orders.id)
+        .outerjoin(Product, lines.product_id == Product.id)
+        .where(orders.id == order_id)
+        .group_by(orders.id, orders.version, User.version)
+    )
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    return "order-{}-v{}-u{}-l{}-p{}".format(order_id, *row)
+
+
+def user_orders_etag(user):
+    """
+    ETag for GET /users/<id>?expand=orders: the user's version plus the
+    count, ids, versions and latest update of their orders, so creating,
+    changing, deleting or archiving an order changes it.
+    """
+    count, ids, versions, updated = db.session.execute(
+        select(
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.id), 0),
+            func.coalesce(func.sum(Order.version), 0),
+            func.max(Order.updated_at),
+        ).where(Order.user_id == user.id)
+    ).one()
+    stamp = int(_utc(updated).timestamp()) if updated else 0
+    return f"{row_etag(user)}-o{count}-{ids}-{versions}-{stamp}"
+
+
+def content_etag(payload):
+    """Strong ETag from the serialized body, for responses with no single row."""
+    body = current_app.json.dumps(payload).encode()
+    return hashlib.sha1(body).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Return a 304 response when the client's cached copy is still current,
+    otherwise None. If-None-Match wins over If-Modified-Since.
+    """
+    if request.if_none_match:
+        matched = _matching(request.if_none_match, etag)
+        if matched:
+            # The client's copy may be a compressed one, confirm its tag
+            return _304(matched, last_modified)
+        return None
+
+    since = request.if_modified_since
+    if last_modified is not None and since is not None:
+        if _utc(last_modified).replace(microsecond=0) <= since:
+            return _304(etag, last_modified)
+    return None
+
+
+def precondition_failed(etag):
+    """
+    Optimistic concurrency for writes: returns a 412 response when the
+    request's If-Match doesn't match the current ETag, otherwise None.
+    Requests without If-Match skip the check, and retry_stale runs them
+    again if a concurrent change beats their write. `etag` may be a
+    function, called only when the request sends If-Match.
+    """
+    if not request.if_match:
+        return None
+    if callable(etag):
+        etag = etag()
+    if not _matching(request.if_match, etag):
+        return (
+            jsonify({"message": "Resource was modified, fetch it again and retry"}),
+            412,
+        )
+    return None
+
+
+def stale_write():
+    # Returned when a versioned UPDATE matched no row (StaleDataError)
+    db.session.rollback()
+    return (
+        jsonify({"message": "Resource was modified concurrently, fetch it again and retry"}),
+        412,
+    )
+
+
+def retry_stale(view):
+    """
+    Decorate writes to versioned rows (User, Order, Product). The mapper
+    updates and deletes them WHERE version = <version loaded>, so a
+    concurrent change in between, a sale taking stock for example,
+    raises StaleDataError. With If-Match the client asked to fail then:
+    412. Without it the view runs again on the fresh rows, up to
+    STALE_RETRIES more times before giving up with 412.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        for attempt in range(STALE_RETRIES + 1):
+            try:
+                return view(*args, **kwargs)
+            except StaleDataError:
+                if request.if_match or attempt == STALE_RETRIES:
+                    return stale_write()
+                db.session.rollback()
+
+    return wrapper
+
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified to a (response, status) tuple."""
+    response, status = response
+    response = make_response(response, status)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    return response
+
+
+def _matching(header, etag):
+    """
+    The tag in If-None-Match / If-Match naming `etag`, as sent or with a
+    compression suffix (compress.py), or None.
+    """
+    for candidate in (etag, *(coded_etag(etag, coding) for coding in DEFAULT_LEVELS)):
+        if header.contains(candidate):
+            return candidate
+    return None
+
+
+def _304(etag, last_modified):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    return response
+
+
+def _utc(value):
+    # Columns are naive DATETIME written by the database clock in UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
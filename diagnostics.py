@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from models import db
+
+
+class QueryCounter:
+    """Collects every statement sent to the database while it is listening."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Count the statements executed inside the block.
+
+    with app.app_context(), count_queries() as queries:
+        client.get("/orders")
+    print(queries.count, queries.statements)
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """
+    Fail when the block runs more than `limit` statements. Used to prove
+    that a route issues a fixed number of queries however many rows it
+    returns, i.e. that it has no N+1 lazy loads.
+    """
+    with count_queries(engine) as queries:
+        yield queries
+
+    if queries.count > limit:
+        listing = "\n".join(queries.statements)
+        raise AssertionError(
+            f"Expected at most {limit} queries, {queries.count} ran:\n{listing}"
+        )
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN <statement>, compiled for the engine's dialect."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def explain(stmt, session=None):
+    """
+    The database's plan for a SELECT, one line per step.
+
+    SQLite:  ['SEARCH orders USING INDEX ix_orders_user_id_order_date (user_id=?)']
+    MySQL:   ['orders: type=ref key=ix_orders_user_id_order_date rows=12 Using where']
+    """
+    session = session or db.session
+    result = session.execute(Explain(stmt))
+    if session.get_bind().dialect.name == "sqlite":
+        return [row.detail for row in result]
+    return [
+        f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}"
+        + (f" {row['Extra']}" if row["Extra"] else "")
+        for row in result.mappings()
+    ]
+
+
+def assert_uses_index(stmt, index, session=None):
+    """
+    Fail unless the plan for `stmt` reads through `index`, i.e. the query
+    is served by that index rather than a full table scan.
+
+    with app.app_context():
+        assert_uses_index(select(Order).where(Order.user_id == 1),
+                          "ix_orders_user_id_order_date")
+    """
+    plan = explain(stmt, session)
+    if not any(index in line for line in plan):
+        listing = "\n".join(plan)
+        raise AssertionError(f"Expected the plan to use {index}:\n{listing}")
+    return plan
@@ -0,0 +1,104 @@
+"""
+Sparse fieldsets and expansions for the read endpoints.
+
+    GET /orders?fields=id,order_date                       - no lines, no user
+    GET /orders?fields=id,user.name,products.quantity
+    GET /users/7?expand=orders                             - the user's orders too
+    GET /users?expand=orders&fields=id,name,orders.id
+
+?fields= lists the JSON keys to keep, with dots for nested ones; naming a
+nested object without a subfield keeps all of its fields. ?expand= adds
+the nested fields the base schema instance excludes (users' orders).
+
+requested_schema() turns the parameters into a schema built with only=
+and a shorter exclude=, cached per field combination, and
+query_options() gives the matching loader options: relationships that
+aren't dumped aren't loaded, and only the dumped columns are selected.
+The compiled serializer compiles the variant the same way.
+
+ETags still name the row version, so If-Match works with an ETag read
+through any field set; the query string keeps caches apart.
+"""
+from functools import lru_cache
+
+from flask import request
+from marshmallow import fields as ma_fields
+
+from loaders import loader_options
+
+# Variants kept per base schema and field combination
+VARIANT_CACHE_SIZE = 256
+
+
+def requested_schema(schema):
+    """
+    `schema`, or its variant for the request's ?fields= and ?expand=.
+    Raises ValueError with a client-facing message for unknown names.
+    """
+    fields = _names("fields")
+    expand = _names("expand")
+    if not fields and not expand:
+        return schema
+    return schema_variant(schema, fields, expand)
+
+
+def query_options(schema, model=None):
+    """Loader options for a schema from requested_schema()."""
+    return loader_options(schema, model, columns=schema.only is not None)
+
+
+def variant_key(schema):
+    """The field set of a schema as a string, "" for the full one; for cache keys."""
+    return getattr(schema, "fieldset", "")
+
+
+@lru_cache(maxsize=VARIANT_CACHE_SIZE)
+def schema_variant(schema, fields, expand):
+    schema_class = type(schema)
+    expandable = _expandable(schema)
+    unknown = [name for name in expand if name not in expandable]
+    if unknown:
+        raise ValueError(
+            f"Cannot expand {', '.join(unknown)}; expandable: {', '.join(expandable) or 'none'}"
+        )
+
+    expanded = {expandable[name] for name in expand}
+    exclude = tuple(sorted(set(schema.exclude) - expanded))
+    full = schema_class(many=schema.many, exclude=exclude)
+    only = tuple(_resolve(full, path) for path in fields) or None
+    variant = schema_class(many=schema.many, exclude=exclude, only=only)
+    variant.fieldset = f"fields={','.join(fields)}&expand={','.join(expand)}"
+    return variant
+
+
+def _names(arg):
+    value = request.args.get(arg, "")
+    return tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+
+
+def _expandable(schema):
+    # Nested fields the instance excludes, by JSON key
+    return {
+        field.data_key or name: name
+        for name, field in schema.declared_fields.items()
+        if isinstance(field, ma_fields.Nested) and name in schema.exclude
+    }
+
+
+def _resolve(schema, path):
+    """JSON key path -> field name path, e.g. products.quantity -> order_products.quantity."""
+    names = []
+    parts = path.split(".")
+    for i, part in enumerate(parts):
+        field = next(
+            (f for name, f in schema.dump_fields.items() if (f.data_key or name) == part),
+            None,
+        )
+        if field is None:
+            raise ValueError(f"Unknown field {path!r}")
+        names.append(field.name)
+        if i < len(parts) - 1:
+            if not isinstance(field, ma_fields.Nested):
+                raise ValueError(f"Unknown field {path!r}, {part} has no subfields")
+            schema = field.schema
+    return ".".join(names)
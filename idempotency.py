@@ -0,0 +1,280 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Defaults for the IDEMPOTENCY_* config keys, in seconds
+DEFAULT_TTL = 24 * 3600  # how long a response is replayed
+DEFAULT_LEASE = 30  # how long a running request owns its key
+DEFAULT_WAIT = 10  # how long a duplicate waits for the first to finish
+POLL_INTERVAL = 0.1
+
+# Not a final answer, a retry with the same key may succeed: a server
+# error, or a conflict with a concurrent change (out of stock, 412)
+RETRYABLE = {409, 412}
+
+# session.info key of the on_commit() callbacks waiting for _run's commit
+ON_COMMIT = "idempotency_on_commit"
+
+# Keys being run by this process, so duplicates wait on an Event instead
+# of polling the table
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def idempotent(view):
+    """
+    Make a write endpoint safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs the view and stores its response
+    (anything below 500 but 409 and 412); later requests with the same key get that
+    response replayed, with Idempotent-Replayed: true, without running the
+    view again. A duplicate that arrives while the first is still running
+    waits for it, up to IDEMPOTENCY_WAIT seconds, then gets 409. Reusing a
+    key for a different method, path or body is rejected with 422.
+    Requests without the header are not affected.
+
+    The view's writes and the stored response commit in one transaction,
+    so a request either happened, with its response kept, or didn't.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            message = f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+            return jsonify({"message": message}), 400
+
+        event, owner = _join(key)
+        try:
+            if not owner:
+                event.wait(_setting("IDEMPOTENCY_WAIT", DEFAULT_WAIT))
+            response = _claim(key, fingerprint())
+            if response is not None:
+                return response
+            return _run(key, view, args, kwargs)
+        finally:
+            if owner:
+                _leave(key, event)
+
+    return wrapper
+
+
+def on_commit(callback):
+    """
+    Run callback() once the view's writes are committed: right away after
+    its own commit(), or under @idempotent, where that commit() only
+    flushes, after the real commit with the stored response. Dropped if
+    the writes are rolled back.
+    """
+    pending = db.session().info.get(ON_COMMIT)
+    if pending is None:
+        callback()
+    else:
+        pending.append(callback)
+
+
+def fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def purge_expired(batch_size=1000):
+    """Delete keys past their TTL in batches; returns how many were removed."""
+    removed = 0
+    while True:
+        keys = db.session.execute(
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < _now())
+            .limit(batch_size)
+        ).scalars().all()
+        if not keys:
+            return removed
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(keys)))
+        db.session.commit()
+        removed += len(keys)
+
+
+def _claim(key, request_hash):
+    """
+    Take ownership of `key` and return None, or return the response to
+    send instead: the stored one, a 409 while another request still runs
+    it, or a 422 when the key was used for a different request.
+    """
+    deadline = time.monotonic() + _setting("IDEMPOTENCY_WAIT", DEFAULT_WAIT)
+    while True:
+        if _insert(key, request_hash):
+            return None
+
+        while True:
+            record = db.session.get(IdempotencyKey, key, populate_existing=True)
+            if record is None:
+                break  # purged in between, try to insert again
+
+            now = _now()
+            expired = record.expires_at <= now
+            abandoned = record.status_code is None and record.locked_until <= now
+            if expired or abandoned:
+                # The owner crashed or the key outlived its TTL
+                if _take_over(record, request_hash):
+                    return None
+                continue
+
+            if record.request_hash != request_hash:
+                message = f"{HEADER} was already used for a different request"
+                return jsonify({"message": message}), 422
+            if record.status_code is not None:
+                return _replay(record)
+            if time.monotonic() >= deadline:
+                message = f"A request with this {HEADER} is still in progress, retry later"
+                return jsonify({"message": message}), 409
+
+            # End the transaction so the next read sees the owner's commit
+            db.session.rollback()
+            time.sleep(POLL_INTERVAL)
+
+
+def _insert(key, request_hash):
+    db.session.add(IdempotencyKey(key=key, request_hash=request_hash, **_lease()))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def _take_over(record, request_hash):
+    # Conditional on the values just read, so only one request wins
+    result = db.session.execute(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.key == record.key,
+            IdempotencyKey.expires_at == record.expires_at,
+            IdempotencyKey.locked_until.is_(None)
+            if record.locked_until is None
+            else IdempotencyKey.locked_until == record.locked_until,
+        )
+        .values(
+            request_hash=request_hash,
+            status_code=None,
+            response_body=None,
+            content_type=None,
+            etag=None,
+            **_lease(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _run(key, view, args, kwargs):
+    # The view's commit() only flushes, so its writes commit together with
+    # the stored response below: a crash in between can't leave a committed
+    # write whose key a retry would take over and run again
+    session = db.session()
+    committed = []
+    callbacks = session.info[ON_COMMIT] = []
+    session.commit = lambda: (session.flush(), committed.append(True))
+    try:
+        response = make_response(view(*args, **kwargs))
+    except Exception:
+        _release(key)
+        raise
+    finally:
+        del session.commit
+        del session.info[ON_COMMIT]
+
+    if response.status_code >= 500 or response.status_code in RETRYABLE:
+        # Not a final answer, let a retry run the request again
+        _release(key)
+        return response
+    if not committed:
+        # Drop anything the view left uncommitted before writing the key
+        db.session.rollback()
+
+    try:
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(
+                status_code=response.status_code,
+                response_body=response.get_data(),
+                content_type=response.content_type,
+                etag=response.headers.get("ETag"),
+                locked_until=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        _release(key)
+        raise
+    if committed:
+        for callback in callbacks:
+            callback()
+    return response
+
+
+def _release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def _replay(record):
+    response = make_response(record.response_body, record.status_code)
+    response.content_type = record.content_type
+    if record.etag:
+        response.headers["ETag"] = record.etag
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _join(key):
+    """Return (event, True) for the first request with `key` in this process."""
+    with _inflight_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return event, False
+        event = _inflight[key] = threading.Event()
+        return event, True
+
+
+def _leave(key, event):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    event.set()
+
+
+def _lease():
+    now = _now()
+    lease = _setting("IDEMPOTENCY_LEASE", DEFAULT_LEASE)
+    ttl = _setting("IDEMPOTENCY_KEY_TTL", DEFAULT_TTL)
+    return {
+        "locked_until": now + timedelta(seconds=lease),
+        "expires_at": now + timedelta(seconds=ttl),
+    }
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default)
+
+
+def _now():
+    # Naive UTC, like the other DATETIME columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
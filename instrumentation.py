@@ -0,0 +1,263 @@
+"""
+Per-request performance numbers: statements run, SQL time, schema load
+and dump time, response size and total time.
+
+Every request gets them as a Server-Timing header and one JSON log line
+(logger "instrumentation"), and they are aggregated per endpoint for
+GET /metrics/requests. Statements slower than SLOW_QUERY_MS are logged
+with their bound parameters replaced by type names.
+
+Config (defaults in brackets): INSTRUMENTATION_ENABLED [True],
+SERVER_TIMING [True], REQUEST_LOG [True], SLOW_QUERY_MS [200].
+
+SQL run while a streamed (NDJSON) body is sent happens after the
+response is finalised and isn't counted.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the request duration histogram buckets
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+_listening = False
+
+
+class RequestStats:
+    """Numbers collected while one request runs, kept on flask.g."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.load = 0.0
+        self.dump = 0.0
+        self.depth = 0  # nested schema calls are timed by the outermost one
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "sql_ms": _ms(self.sql),
+            "load_ms": _ms(self.load),
+            "dump_ms": _ms(self.dump),
+        }
+
+
+class EndpointHistogram:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is > BUCKETS[-1]
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.load_ms = 0.0
+        self.dump_ms = 0.0
+        self.bytes = 0
+
+    def add(self, line):
+        self.count += 1
+        self.buckets[bisect.bisect_left(BUCKETS, line["ms"])] += 1
+        self.total_ms += line["ms"]
+        self.max_ms = max(self.max_ms, line["ms"])
+        self.queries += line["queries"]
+        self.sql_ms += line["sql_ms"]
+        self.load_ms += line["load_ms"]
+        self.dump_ms += line["dump_ms"]
+        self.bytes += line["bytes"] or 0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            # le_ms is the bucket's upper bound, null for the overflow bucket
+            "buckets": [
+                {"le_ms": bound, "count": count}
+                for bound, count in zip(BUCKETS + (None,), self.buckets)
+            ],
+            "avg_ms": _ms(self.total_ms / self.count / 1000),
+            "max_ms": round(self.max_ms, 3),
+            "avg_queries": round(self.queries / self.count, 2),
+            "avg_sql_ms": _ms(self.sql_ms / self.count / 1000),
+            "avg_load_ms": _ms(self.load_ms / self.count / 1000),
+            "avg_dump_ms": _ms(self.dump_ms / self.count / 1000),
+            "avg_bytes": round(self.bytes / self.count),
+        }
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def init_app(self, app):
+        app.config.setdefault("INSTRUMENTATION_ENABLED", True)
+        app.config.setdefault("SERVER_TIMING", True)
+        app.config.setdefault("REQUEST_LOG", True)
+        app.config.setdefault("SLOW_QUERY_MS", 200)
+        if not app.config["INSTRUMENTATION_ENABLED"]:
+            return
+
+        _listen_to_engines()
+        app.before_request(_start_request)
+        app.after_request(self._finish_request)
+
+    def stats(self):
+        with self.lock:
+            return {
+                endpoint: histogram.as_dict()
+                for endpoint, histogram in sorted(self.endpoints.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def _finish_request(self, response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+
+        elapsed = time.perf_counter() - stats.start
+        # Requests that matched no route are grouped together
+        endpoint = request.endpoint or "<unmatched>"
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "ms": _ms(elapsed),
+            **stats.as_dict(),
+            # Unknown for streamed bodies
+            "bytes": response.content_length,
+        }
+
+        with self.lock:
+            histogram = self.endpoints.get(endpoint)
+            if histogram is None:
+                histogram = self.endpoints[endpoint] = EndpointHistogram()
+            histogram.add(line)
+
+        config = current_app.config
+        if config["SERVER_TIMING"]:
+            response.headers["Server-Timing"] = ", ".join(
+                [
+                    f'sql;dur={line["sql_ms"]};desc="{stats.queries} queries"',
+                    f"load;dur={line['load_ms']}",
+                    f"dump;dur={line['dump_ms']}",
+                    f"total;dur={line['ms']}",
+                ]
+            )
+        if config["REQUEST_LOG"]:
+            logger.info(json.dumps(line))
+        return response
+
+
+class TimedSchema:
+    """
+    Mixin for marshmallow schemas that adds their load() and dump() time
+    to the current request. Load time includes the validators, and any
+    queries they run.
+    """
+
+    def dump(self, *args, **kwargs):
+        with _timed("dump"):
+            return super().dump(*args, **kwargs)
+
+    def load(self, *args, **kwargs):
+        with _timed("load"):
+            return super().load(*args, **kwargs)
+
+
+def redact(parameters):
+    """Bound parameters with every value replaced by its type name."""
+    if isinstance(parameters, dict):
+        return {key: f"<{type(value).__name__}>" for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return f"<{len(parameters)} rows>"
+        return [f"<{type(value).__name__}>" for value in parameters]
+    return "<redacted>"
+
+
+@contextmanager
+def _timed(kind):
+    stats = _current()
+    if stats is None or stats.depth:
+        yield
+        return
+
+    stats.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.depth -= 1
+        setattr(stats, kind, getattr(stats, kind) + time.perf_counter() - start)
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+
+
+def _current():
+    if not has_app_context():
+        return None
+    return g.get("request_stats")
+
+
+def _listen_to_engines():
+    # Listeners on the Engine class see every engine, once per process
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+    event.listen(Engine, "handle_error", _on_error)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    stats = _current()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql += elapsed
+
+    if has_app_context() and elapsed * 1000 >= current_app.config.get("SLOW_QUERY_MS", 200):
+        logger.warning(
+            json.dumps(
+                {
+                    "slow_query_ms": _ms(elapsed),
+                    "statement": statement,
+                    "parameters": redact(parameters),
+                    "endpoint": request.endpoint if has_request_context() else None,
+                }
+            )
+        )
+
+
+def _on_error(context):
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,122 @@
+"""
+Stock changes for order lines.
+
+Every change is one conditional UPDATE per product,
+
+    UPDATE products SET stock = stock - :n, ... WHERE id = :id AND stock >= :n
+
+so concurrent orders can't oversell and nothing is read and written back:
+the database queues writers on the row and each re-checks the condition.
+Products are always updated in ascending id, so orders sharing products
+lock them in the same order and can't deadlock each other. Products with
+stock NULL aren't tracked and are left alone.
+
+The UPDATEs also bump the product's version (its ETag and optimistic
+lock) and updated_at. Callers pass the changed ids to
+product_cache.invalidate after committing.
+"""
+from collections import Counter
+
+from sqlalchemy import select, update
+
+from models import db, OrderProduct, Product
+
+
+class OutOfStock(Exception):
+    """A tracked product has fewer units than an order asked for."""
+
+    def __init__(self, shortages):
+        # [{"product_id": 5, "requested": 3, "available": 1}]
+        self.shortages = shortages
+        super().__init__(
+            "; ".join(
+                f"Product id {s['product_id']} has {s['available']} in stock, "
+                f"{s['requested']} requested"
+                for s in shortages
+            )
+        )
+
+
+def adjust(deltas, session=None):
+    """
+    Apply {product_id: units} to stock: positive units are taken, negative
+    ones put back. Raises OutOfStock if any tracked product is short; the
+    caller must then roll back. Returns the ids whose stock changed.
+    `session` defaults to db.session (async_app.py passes its own).
+    """
+    session = session or db.session
+    changed = []
+    short = {}
+    for product_id in sorted(deltas):
+        units = deltas[product_id]
+        if not units:
+            continue
+        stmt = update(Product).where(Product.id == product_id)
+        if units > 0:
+            stmt = stmt.where(Product.stock >= units)
+        else:
+            stmt = stmt.where(Product.stock.is_not(None))
+        result = session.execute(
+            stmt.values(stock=Product.stock - units, version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            changed.append(product_id)
+        elif units > 0:
+            short[product_id] = units
+
+    if short:
+        # No row matched: either short or untracked (stock NULL)
+        stmt = select(Product.id, Product.stock).where(Product.id.in_(short))
+        shortages = [
+            {"product_id": product_id, "requested": short[product_id], "available": stock}
+            for product_id, stock in session.execute(stmt)
+            if stock is not None
+        ]
+        if shortages:
+            raise OutOfStock(sorted(shortages, key=lambda s: s["product_id"]))
+    return changed
+
+
+def set_stock(product_id, seen, stock, session=None):
+    """
+    Make `stock` the product's units on hand, given the `seen` units the
+    caller read: the difference goes through adjust(), so units sold in
+    between still come off (or OutOfStock when fewer than the difference
+    are left). An untracked product (seen None) starts at `stock`.
+    """
+    session = session or db.session
+    if seen is not None:
+        return adjust({product_id: seen - stock}, session)
+    result = session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock.is_(None))
+        .values(stock=stock, version=Product.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return [product_id] if result.rowcount else []
+
+
+def reserve(lines, session=None):
+    """Take stock for [(product_id, quantity)]; see adjust()."""
+    totals = Counter()
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    return adjust(totals, session)
+
+
+def restock_orders(order_ids):
+    """
+    Put back the stock of every line of the given orders (a list or a
+    SELECT of ids), before they are deleted. The lines are locked so a
+    concurrent line change can't alter them in between.
+    """
+    stmt = (
+        select(OrderProduct.product_id, OrderProduct.quantity)
+        .where(OrderProduct.order_id.in_(order_ids))
+        .with_for_update()
+    )
+    totals = Counter()
+    for product_id, quantity in db.session.execute(stmt):
+        totals[product_id] -= quantity
+    return adjust(totals)
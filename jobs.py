@@ -0,0 +1,310 @@
+"""
+Database-backed queue for side effects that shouldn't hold up a request.
+
+Routes call enqueue() before their commit, so the job row is written in
+the same transaction as the order (a transactional outbox): if the
+commit fails there is no job, and if it succeeds the job is in the table
+even if the process dies right after. Workers started with
+
+    flask --app script run-worker
+
+claim due jobs with a lease, run their handler and delete them in the
+handler's transaction. A handler may return a function to call once that
+transaction has committed (e.g. cache invalidation). A job whose worker
+crashed is picked up again once its lease (JOB_LEASE) runs out, so
+handlers must be safe to run twice.
+Failures are retried with exponential backoff (JOB_BACKOFF doubling up to
+JOB_BACKOFF_MAX, with jitter); after JOB_MAX_ATTEMPTS the job moves to
+dead_jobs, where `flask --app script requeue-dead-jobs` puts it back.
+"""
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import selectinload
+
+from cache import product_cache
+from inventory import restock_orders
+from models import db, DeadJob, Job, Order, OrderProduct, User
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the JOB_* config keys, times in seconds
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF = 10
+DEFAULT_BACKOFF_MAX = 3600
+DEFAULT_LEASE = 300
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_PURGE_BATCH_SIZE = 500
+MAX_ERROR_LENGTH = 2000
+
+# job name -> handler(payload)
+handlers = {}
+
+
+def handler(name):
+    """
+    Register the function that runs jobs called `name`. It gets the
+    payload and may return a function to call after its commit.
+    """
+
+    def register(fn):
+        handlers[name] = fn
+        return fn
+
+    return register
+
+
+def enqueue(name, payload, delay=0, session=None):
+    """
+    Add a job to the current transaction; it's queued when that commits.
+    `payload` must be JSON-serialisable. `session` defaults to db.session
+    (async_app.py passes its own through run_sync).
+    """
+    now = _now()
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        attempts=0,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+    )
+    (session or db.session).add(job)
+    return job
+
+
+def enqueue_many(name, payloads):
+    """enqueue() for many jobs as one executemany INSERT."""
+    if not payloads:
+        return
+    now = _now()
+    db.session.execute(
+        insert(Job),
+        [
+            {
+                "name": name,
+                "payload": json.dumps(payload),
+                "attempts": 0,
+                "run_at": now,
+                "created_at": now,
+            }
+            for payload in payloads
+        ],
+    )
+
+
+def run_pending(batch_size=DEFAULT_BATCH_SIZE):
+    """Claim and run up to `batch_size` due jobs; returns how many ran."""
+    job_ids = _claim(batch_size)
+    for job_id in job_ids:
+        _perform(job_id)
+    return len(job_ids)
+
+
+def work(batch_size=DEFAULT_BATCH_SIZE, poll_interval=None, once=False, should_stop=None):
+    """
+    Run jobs until `should_stop()` returns True, sleeping `poll_interval`
+    when the queue is empty. With once=True, stop when it's empty.
+    """
+    if poll_interval is None:
+        poll_interval = _setting("JOB_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)
+    total = 0
+    while not (should_stop and should_stop()):
+        ran = run_pending(batch_size)
+        total += ran
+        if not ran:
+            if once:
+                break
+            time.sleep(poll_interval)
+    return total
+
+
+def requeue_dead(job_ids=None):
+    """Move dead jobs (all, or the given ids) back to the queue."""
+    stmt = select(DeadJob)
+    if job_ids:
+        stmt = stmt.where(DeadJob.id.in_(job_ids))
+    dead = db.session.execute(stmt).scalars().all()
+    now = _now()
+    for job in dead:
+        db.session.add(
+            Job(
+                name=job.name,
+                payload=job.payload,
+                attempts=0,
+                run_at=now,
+                created_at=job.created_at,
+            )
+        )
+        db.session.delete(job)
+    db.session.commit()
+    return len(dead)
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts` (1 for the first retry)."""
+    base = _setting("JOB_BACKOFF", DEFAULT_BACKOFF)
+    delay = min(base * 2 ** (attempts - 1), _setting("JOB_BACKOFF_MAX", DEFAULT_BACKOFF_MAX))
+    # Jitter so jobs that failed together don't retry together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claim(batch_size):
+    now = _now()
+    candidates = db.session.execute(
+        select(Job.id, Job.locked_until)
+        .where(Job.run_at <= now, or_(Job.locked_until.is_(None), Job.locked_until < now))
+        .order_by(Job.run_at, Job.id)
+        .limit(batch_size)
+    ).all()
+
+    lease = now + timedelta(seconds=_setting("JOB_LEASE", DEFAULT_LEASE))
+    claimed = []
+    for job_id, locked_until in candidates:
+        # Conditional on the lease just read, so only one worker wins a job
+        result = db.session.execute(
+            update(Job)
+            .where(
+                Job.id == job_id,
+                Job.locked_until.is_(None)
+                if locked_until is None
+                else Job.locked_until == locked_until,
+            )
+            .values(locked_until=lease, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def _perform(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    name = job.name
+    try:
+        fn = handlers.get(name)
+        if fn is None:
+            raise LookupError(f"No handler for job {name!r}")
+        after_commit = fn(json.loads(job.payload))
+        # Deleted in the handler's transaction: its writes and the job's
+        # removal commit together
+        db.session.delete(job)
+        db.session.commit()
+        if after_commit is not None:
+            after_commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %s (%s) failed", job_id, name)
+        _failed(job_id, f"{type(e).__name__}: {e}"[:MAX_ERROR_LENGTH])
+    finally:
+        db.session.expunge_all()
+
+
+def _failed(job_id, error):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    now = _now()
+    if job.attempts >= _setting("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS):
+        db.session.add(
+            DeadJob(
+                job_id=job.id,
+                name=job.name,
+                payload=job.payload,
+                attempts=job.attempts,
+                last_error=error,
+                created_at=job.created_at,
+                failed_at=now,
+            )
+        )
+        db.session.delete(job)
+        logger.error(
+            "Job %s (%s) moved to dead_jobs after %s attempts", job.id, job.name, job.attempts
+        )
+    else:
+        job.run_at = now + timedelta(seconds=backoff(job.attempts))
+        job.locked_until = None
+        job.last_error = error
+    db.session.commit()
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default)
+
+
+def _now():
+    # Naive UTC, like the DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Order follow-ups
+
+
+@handler("order_confirmation")
+def send_order_confirmation(payload):
+    """
+    Confirmation for a new order. There is no mail service configured yet,
+    so the message is logged; an order deleted in the meantime is skipped.
+    """
+    order = db.session.get(
+        Order,
+        payload["order_id"],
+        options=[
+            selectinload(Order.user),
+            selectinload(Order.order_products).selectinload(OrderProduct.product),
+        ],
+    )
+    if order is None:
+        return
+    total = sum(line.quantity * line.product.price for line in order.order_products)
+    logger.info(
+        "Order confirmation to %s: order %s, %s items, total %.2f",
+        order.user.email,
+        order.id,
+        sum(line.quantity for line in order.order_products),
+        total,
+    )
+
+
+# Account deletion
+
+
+@handler("purge_user")
+def purge_user(payload):
+    """
+    Background DELETE /users/<id> for accounts with many orders. Each run
+    puts back the stock of up to JOB_PURGE_BATCH_SIZE orders, deletes them
+    (the database cascades to their lines and summaries) and queues the
+    next run, so no transaction holds its locks for long. The run that
+    finds fewer orders left deletes the user with them.
+    """
+    user_id = payload["user_id"]
+    batch_size = _setting("JOB_PURGE_BATCH_SIZE", DEFAULT_PURGE_BATCH_SIZE)
+    order_ids = (
+        db.session.execute(
+            select(Order.id).where(Order.user_id == user_id).order_by(Order.id).limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    changed = restock_orders(order_ids)
+    if len(order_ids) == batch_size:
+        db.session.execute(delete(Order).where(Order.id.in_(order_ids)))
+        enqueue("purge_user", payload)
+    else:
+        db.session.execute(delete(User).where(User.id == user_id))
+        logger.info("User %s purged", user_id)
+
+    def invalidate():
+        for product_id in changed:
+            product_cache.invalidate(product_id)
+
+    return invalidate
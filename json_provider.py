@@ -0,0 +1,86 @@
+"""
+JSON encoding for app.json, used by jsonify, schema.jsonify,
+request.get_json and the NDJSON streams.
+
+With orjson installed (pip install orjson) responses are encoded by
+OrjsonProvider, several times faster than the stdlib json module on
+large order listings. Otherwise StdlibProvider, Flask's default provider,
+is used. Both produce the same JSON:
+
+- keys are sorted, so content ETags (conditional.content_etag) don't
+  depend on the encoder,
+- datetimes and dates are ISO 8601, like the schemas dump them,
+- Decimal (what MySQL returns for ROUND and SUM) is a string, like
+  Flask's default provider.
+
+Config: JSON_PROVIDER "auto" (default, orjson when installed), "orjson"
+or "stdlib".
+"""
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider, _default as flask_default
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib provider is used
+    orjson = None
+
+DEFAULT_PROVIDER = "auto"
+
+
+def _default(value):
+    if isinstance(value, date):  # datetime too
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return flask_default(value)
+
+
+class StdlibProvider(DefaultJSONProvider):
+    """Flask's provider with datetimes as ISO 8601 instead of HTTP dates."""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Encodes with orjson, which handles datetime, date, UUID and dataclasses
+    itself and calls _default for the rest. dumps() with extra json.dumps
+    arguments (indent, ...) falls back to the stdlib encoder.
+    """
+
+    default = staticmethod(_default)
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self.options | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            options |= orjson.OPT_INDENT_2
+        # Bytes straight into the response, no str round trip
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=options), mimetype=self.mimetype
+        )
+
+
+def json_provider(app):
+    """The provider JSON_PROVIDER selects, for app.json."""
+    name = app.config.get("JSON_PROVIDER", DEFAULT_PROVIDER)
+    if name not in ("auto", "orjson", "stdlib"):
+        raise ValueError(f"Unknown JSON_PROVIDER {name!r}")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER = 'orjson' needs: pip install orjson")
+    if name == "stdlib" or orjson is None:
+        return StdlibProvider(app)
+    return OrjsonProvider(app)
@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+# Read by the ETag and Last-Modified headers, loaded even if not dumped
+VALIDATOR_COLUMNS = ("version", "updated_at")
+
+
+# Bounded: ?fields= variants (fieldsets.py) add entries
+@lru_cache(maxsize=1024)
+def loader_options(schema, model=None, columns=False):
+    """
+    Build the eager-loading options a query needs so that dumping its
+    results with `schema` never triggers a lazy load.
+
+    Every Nested field the schema will dump is matched to the relationship
+    of the same name: collections get selectinload (one extra SELECT ... IN
+    per relationship), many-to-one gets joinedload (no extra statement).
+    Nested schemas are walked recursively, so
+
+        select(Order).options(*loader_options(orders_schema))
+
+    loads orders, their user, their order_products and each product in a
+    fixed number of statements however many rows come back.
+
+    With columns=True every level also gets load_only() for the columns
+    its schema dumps (plus the primary key and VALIDATOR_COLUMNS), for the
+    narrowed schemas of ?fields=.
+    """
+    model = model or schema.opts.model
+    mapper = inspect(model)
+    options = []
+    dumped = []
+
+    for name, field in schema.dump_fields.items():
+        if not isinstance(field, fields.Nested):
+            dumped.append(field.attribute or name)
+            continue
+        relationship = mapper.relationships.get(field.attribute or name)
+        if relationship is None:
+            continue
+
+        attr = getattr(model, relationship.key)
+        loader = selectinload(attr) if relationship.uselist else joinedload(attr)
+        child_options = loader_options(field.schema, relationship.mapper.class_, columns)
+        if child_options:
+            loader = loader.options(*child_options)
+        options.append(loader)
+
+    if columns:
+        keep = [
+            getattr(model, attr.key)
+            for attr in mapper.column_attrs
+            if attr.key in dumped
+            or attr.key in VALIDATOR_COLUMNS
+            or any(column.primary_key for column in attr.columns)
+        ]
+        options.append(load_only(*keep))
+    return tuple(options)
@@ -0,0 +1,32 @@
+"""Add version and updated_at for ETags and optimistic locking
+
+Revision ID: 9b2f4c1d7e35
+Revises: 53c920241a63
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '9b2f4c1d7e35'
+down_revision: Union[str, Sequence[str], None] = '53c920241a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('users', 'orders', 'products')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,51 @@
+"""Never reuse order ids on SQLite
+
+Revision ID: a7e1c5b9d026
+Revises: f6d0e4a8b315
+Create Date: 2026-10-19 14:36:09.417552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'a7e1c5b9d026'
+down_revision: Union[str, Sequence[str], None] = 'f6d0e4a8b315'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        # InnoDB's AUTO_INCREMENT never goes back
+        return
+
+    # Without AUTOINCREMENT SQLite hands out MAX(id) + 1, an archived
+    # order's id once the newest order was archived. Rebuilding the table
+    # adds it; dropping the old one must not cascade (see d4a8b2e6f193)
+    op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table(
+        'orders', recreate='always', table_kwargs={'sqlite_autoincrement': True}
+    ):
+        pass
+    # Continue after every id handed out so far, archived ones included
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'orders'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'orders', COALESCE(MAX(id), 0) "
+        "FROM (SELECT id FROM orders UNION ALL SELECT id FROM orders_archive)"
+    )
+    op.execute('PRAGMA foreign_keys=ON')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table(
+        'orders', recreate='always', table_kwargs={'sqlite_autoincrement': False}
+    ):
+        pass
+    op.execute('PRAGMA foreign_keys=ON')
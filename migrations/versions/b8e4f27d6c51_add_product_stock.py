@@ -0,0 +1,27 @@
+"""Add products.stock for inventory tracking
+
+Revision ID: b8e4f27d6c51
+Revises: a5d1e9c3b720
+Create Date: 2026-10-18 18:05:44.231907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'b8e4f27d6c51'
+down_revision: Union[str, Sequence[str], None] = 'a5d1e9c3b720'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable: existing products stay untracked until a stock is set
+    op.add_column('products', sa.Column('stock', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'stock')
@@ -0,0 +1,38 @@
+"""Index products.updated_at and log product deletes for search refreshes
+
+Revision ID: b8f2d6a0e137
+Revises: a7e1c5b9d026
+Create Date: 2026-10-19 16:02:51.730418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'b8f2d6a0e137'
+down_revision: Union[str, Sequence[str], None] = 'a7e1c5b9d026'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_updated_at', 'products', ['updated_at'])
+    op.create_table(
+        'product_deletions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_product_deletions_deleted_at', 'product_deletions', ['deleted_at']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_deletions_deleted_at', table_name='product_deletions')
+    op.drop_table('product_deletions')
+    op.drop_index('ix_products_updated_at', table_name='products')
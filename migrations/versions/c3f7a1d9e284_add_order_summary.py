@@ -0,0 +1,58 @@
+"""Add order_summary, filled from the existing orders
+
+Revision ID: c3f7a1d9e284
+Revises: b8e4f27d6c51
+Create Date: 2026-10-18 18:42:19.774120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c3f7a1d9e284'
+down_revision: Union[str, Sequence[str], None] = 'b8e4f27d6c51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'order_summary',
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('order_date', sa.DateTime(), nullable=False),
+        sa.Column('line_count', sa.Integer(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('order_id'),
+    )
+    op.create_index(
+        'ix_order_summary_user_id_order_id', 'order_summary', ['user_id', 'order_id']
+    )
+    op.create_index('ix_order_summary_order_date', 'order_summary', ['order_date'])
+
+    # Backfill in one statement; `flask --app script rebuild-order-summary`
+    # does the same in batches
+    op.execute(
+        """
+        INSERT INTO order_summary
+            (order_id, user_id, order_date, line_count, item_count, total)
+        SELECT o.id, o.user_id, o.order_date, COUNT(op.product_id),
+               COALESCE(SUM(op.quantity), 0),
+               ROUND(COALESCE(SUM(op.quantity * p.price), 0), 2)
+        FROM orders o
+        LEFT JOIN order_product op ON op.order_id = o.id
+        LEFT JOIN products p ON p.id = op.product_id
+        GROUP BY o.id, o.user_id, o.order_date
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_order_summary_order_date', table_name='order_summary')
+    op.drop_index('ix_order_summary_user_id_order_id', table_name='order_summary')
+    op.drop_table('order_summary')
@@ -0,0 +1,57 @@
+"""Add indexes for user -> orders, product -> lines, date ranges and unique email
+
+Revision ID: c41d8e2a6f10
+Revises: 9b2f4c1d7e35
+Create Date: 2026-10-18 16:02:17.530214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c41d8e2a6f10'
+down_revision: Union[str, Sequence[str], None] = '9b2f4c1d7e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    duplicates = bind.execute(
+        sa.text('SELECT email FROM users GROUP BY email HAVING COUNT(*) > 1')
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            'Cannot add uq_users_email, these emails are used by several users: '
+            + ', '.join(duplicates)
+        )
+
+    op.create_index('ix_orders_user_id_order_date', 'orders', ['user_id', 'order_date'])
+    op.create_index('ix_orders_order_date', 'orders', ['order_date'])
+    op.create_index(
+        'ix_order_product_product_order_qty',
+        'order_product',
+        ['product_id', 'order_id', 'quantity'],
+    )
+    op.create_unique_constraint('uq_users_email', 'users', ['email'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        # InnoDB drops its implicit foreign key indexes once the composite
+        # indexes cover them, and refuses to drop an index a foreign key
+        # needs, so put single-column ones back first
+        inspector = sa.inspect(bind)
+        for table, column in (('orders', 'user_id'), ('order_product', 'product_id')):
+            names = {index['name'] for index in inspector.get_indexes(table)}
+            if column not in names:
+                op.create_index(column, table, [column])
+
+    op.drop_constraint('uq_users_email', 'users', type_='unique')
+    op.drop_index('ix_order_product_product_order_qty', table_name='order_product')
+    op.drop_index('ix_orders_order_date', table_name='orders')
+    op.drop_index('ix_orders_user_id_order_date', table_name='orders')
@@ -0,0 +1,31 @@
+"""Keep the product price on archived order lines
+
+Revision ID: c9a3e7f1b248
+Revises: b8f2d6a0e137
+Create Date: 2026-10-19 17:24:13.583920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c9a3e7f1b248'
+down_revision: Union[str, Sequence[str], None] = 'b8f2d6a0e137'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('order_product_archive', sa.Column('unit_price', sa.Float(), nullable=True))
+    # Lines archived so far get today's price, the closest there is
+    op.execute(
+        'UPDATE order_product_archive SET unit_price = '
+        '(SELECT price FROM products WHERE products.id = order_product_archive.product_id)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('order_product_archive', 'unit_price')
@@ -0,0 +1,78 @@
+"""Make sure the order foreign keys cascade deletes in the database
+
+Revision ID: d4a8b2e6f193
+Revises: c3f7a1d9e284
+Create Date: 2026-10-18 21:07:42.318904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'd4a8b2e6f193'
+down_revision: Union[str, Sequence[str], None] = 'c3f7a1d9e284'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referred table): deleting a user or an order relies on
+# these being ON DELETE CASCADE, the ORM no longer loads the children
+CASCADES = [
+    ('orders', 'user_id', 'users'),
+    ('order_product', 'order_id', 'orders'),
+    ('order_summary', 'order_id', 'orders'),
+]
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    sqlite = bind.dialect.name == 'sqlite'
+    if sqlite:
+        # The app turns enforcement on per connection (models.py); batch mode
+        # rebuilds tables, and dropping the old one would cascade
+        op.execute('PRAGMA foreign_keys=OFF')
+
+    # Databases that didn't enforce the keys (SQLite) may hold orphans;
+    # parents first so their lines and summaries go too
+    for table, column, referred in CASCADES:
+        op.execute(
+            f"DELETE FROM {table} WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {referred} WHERE {referred}.id = {table}.{column})"
+        )
+
+    inspector = sa.inspect(bind)
+    for table, column, referred in CASCADES:
+        current = [
+            fk
+            for fk in inspector.get_foreign_keys(table)
+            if fk['referred_table'] == referred and fk['constrained_columns'] == [column]
+        ]
+        if any(
+            (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE'
+            for fk in current
+        ):
+            continue
+
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for fk in current:
+                batch_op.drop_constraint(
+                    fk['name'] or f'fk_{table}_{column}_{referred}', type_='foreignkey'
+                )
+            batch_op.create_foreign_key(
+                f'fk_{table}_{column}_{referred}',
+                referred,
+                [column],
+                ['id'],
+                ondelete='CASCADE',
+            )
+
+    if sqlite:
+        op.execute('PRAGMA foreign_keys=ON')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Nothing to undo: the cascades match what the models declare
+    pass
@@ -0,0 +1,62 @@
+"""Add orders_archive and order_product_archive
+
+Revision ID: e5c9d3f7a204
+Revises: d4a8b2e6f193
+Create Date: 2026-10-18 22:31:05.640217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'e5c9d3f7a204'
+down_revision: Union[str, Sequence[str], None] = 'd4a8b2e6f193'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled by `flask --app script archive-orders` (archive.py)
+    op.create_table(
+        'orders_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('order_date', sa.DateTime(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('line_count', sa.Integer(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_row_format='COMPRESSED',
+    )
+    op.create_index('ix_orders_archive_user_id_id', 'orders_archive', ['user_id', 'id'])
+    op.create_index('ix_orders_archive_order_date', 'orders_archive', ['order_date'])
+
+    op.create_table(
+        'order_product_archive',
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['orders_archive.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id']),
+        sa.PrimaryKeyConstraint('order_id', 'product_id'),
+        mysql_row_format='COMPRESSED',
+    )
+    op.create_index(
+        'ix_order_product_archive_product_id', 'order_product_archive', ['product_id']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Drops the archived orders with the tables
+    op.drop_index('ix_order_product_archive_product_id', table_name='order_product_archive')
+    op.drop_table('order_product_archive')
+    op.drop_index('ix_orders_archive_order_date', table_name='orders_archive')
+    op.drop_index('ix_orders_archive_user_id_id', table_name='orders_archive')
+    op.drop_table('orders_archive')
@@ -0,0 +1,39 @@
+"""Add idempotency_keys for Idempotency-Key replays
+
+Revision ID: e7a3f95b2c48
+Revises: c41d8e2a6f10
+Create Date: 2026-10-18 16:48:05.117342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'e7a3f95b2c48'
+down_revision: Union[str, Sequence[str], None] = 'c41d8e2a6f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.LargeBinary(length=2**24 - 1), nullable=True),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('etag', sa.String(length=255), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
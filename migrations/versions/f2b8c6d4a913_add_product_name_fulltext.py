@@ -0,0 +1,33 @@
+"""Add a FULLTEXT index on products.product_name for product search
+
+Revision ID: f2b8c6d4a913
+Revises: e7a3f95b2c48
+Create Date: 2026-10-18 17:21:44.860129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = 'f2b8c6d4a913'
+down_revision: Union[str, Sequence[str], None] = 'e7a3f95b2c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Other databases search with the in-process index, see search.py
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_index(
+            'ix_products_product_name_fulltext',
+            'products',
+            ['product_name'],
+            mysql_prefix='FULLTEXT',
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ix_products_product_name_fulltext', table_name='products')
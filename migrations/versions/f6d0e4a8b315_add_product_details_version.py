@@ -0,0 +1,29 @@
+"""Add products.details_version for order ETags
+
+Revision ID: f6d0e4a8b315
+Revises: e5c9d3f7a204
+Create Date: 2026-10-19 10:12:48.205316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'f6d0e4a8b315'
+down_revision: Union[str, Sequence[str], None] = 'e5c9d3f7a204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'products',
+        sa.Column('details_version', sa.Integer(), server_default='1', nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'details_version')
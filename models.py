@@ -1,15 +1,42 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, String, Integer, DateTime, func, Float
+from sqlalchemy import (
+    event,
+    ForeignKey,
+    String,
+    Integer,
+    DateTime,
+    func,
+    Float,
+    Index,
+    LargeBinary,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.engine import Engine
 from typing import List
 from datetime import datetime
 
+from replicas import RoutingSession
+
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+# GET requests read from the replicas when configured, see replicas.py
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless asked per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 
 class OrderProduct(Base):
@@ -20,6 +47,12 @@ class OrderProduct(Base):
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id"), primary_key=True)
     quantity: Mapped[int] = mapped_column(Integer, nullable=False)
 
+    # The primary key serves order -> lines; this serves product -> lines
+    # and covers the report aggregates without touching the table
+    __table_args__ = (
+        Index("ix_order_product_product_order_qty", "product_id", "order_id", "quantity"),
+    )
+
     # Relationships
     order: Mapped["Order"] = relationship(back_populates="order_products")
     product: Mapped["Product"] = relationship(back_populates="order_products")
@@ -31,10 +64,20 @@ class User(Base):
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     address: Mapped[str] = mapped_column(String(100), nullable=False)
     email: Mapped[str] = mapped_column(String(254), nullable=False)
+    # Bumped on every UPDATE; backs ETags and optimistic locking
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, insert_default=func.now(), onupdate=func.now()
+    )
 
-    # One-to-many with cascade delete
+    __table_args__ = (UniqueConstraint("email", name="uq_users_email"),)
+    __mapper_args__ = {"version_id_col": version}
+
+    # One-to-many with cascade delete. passive_deletes: deleting a user
+    # doesn't load the orders, the orders.user_id FK (ON DELETE CASCADE)
+    # removes them and their lines in the database
     orders: Mapped[List["Order"]] = relationship(
-        back_populates="user", cascade="all, delete-orphan"
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
@@ -43,23 +86,216 @@ class Order(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     order_date: Mapped[datetime] = mapped_column(DateTime, insert_default=func.now())
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, insert_default=func.now(), onupdate=func.now()
+    )
+
+    __table_args__ = (
+        # A user's orders, optionally by date; also backs the user_id FK
+        Index("ix_orders_user_id_order_date", "user_id", "order_date"),
+        # Date-range scans in the reports
+        Index("ix_orders_order_date", "order_date"),
+        # Archived orders keep their id (archive.py): SQLite must not hand
+        # out the highest one again once it has moved. InnoDB never does
+        {"sqlite_autoincrement": True},
+    )
+    __mapper_args__ = {"version_id_col": version}
 
-    # One-to-many with cascade delete for order_products
+    # One-to-many with cascade delete for order_products, left to the
+    # order_product.order_id FK like User.orders
     order_products: Mapped[List["OrderProduct"]] = relationship(
-        back_populates="order", cascade="all, delete-orphan"
+        back_populates="order",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="OrderProduct.product_id",
     )
 
     # Backref to user
     user: Mapped["User"] = relationship(back_populates="orders")
 
 
+class OrderSummary(Base):
+    """
+    One row per order with its line count, item count and total, kept in
+    step with order_product by order_summary.py in the same transaction
+    as every line change, so order lists don't aggregate lines per request.
+    """
+
+    __tablename__ = "order_summary"
+    order_id: Mapped[int] = mapped_column(
+        ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    order_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    line_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # At current product prices, like the reports
+    total: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        # GET /users/<id>/orders pages through one user's rows by order id
+        Index("ix_order_summary_user_id_order_id", "user_id", "order_id"),
+        Index("ix_order_summary_order_date", "order_date"),
+    )
+
+
+class ArchivedOrder(Base):
+    """
+    An order moved out of orders by archive.py, with the summary it had
+    then. Same id, columns and relationship names as Order, so the order
+    schemas dump it unchanged. Read-only.
+    """
+
+    __tablename__ = "orders_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    order_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, insert_default=func.now()
+    )
+    line_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # At the product prices of when it was archived
+    total: Mapped[float] = mapped_column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_orders_archive_user_id_id", "user_id", "id"),
+        Index("ix_orders_archive_order_date", "order_date"),
+        # Rarely read: InnoDB keeps the pages compressed
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+    # No back_populates: users never load their archive, and deleting a
+    # user leaves it to the user_id FK
+    user: Mapped["User"] = relationship()
+    order_products: Mapped[List["ArchivedOrderProduct"]] = relationship(
+        back_populates="order",
+        passive_deletes=True,
+        order_by="ArchivedOrderProduct.product_id",
+    )
+
+
+class ArchivedOrderProduct(Base):
+    __tablename__ = "order_product_archive"
+    order_id: Mapped[int] = mapped_column(
+        ForeignKey("orders_archive.id", ondelete="CASCADE"), primary_key=True
+    )
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id"), primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    # The product's price when archived, which the reports value it at
+    # like orders_archive.total
+    unit_price: Mapped[float] = mapped_column(Float)
+
+    __table_args__ = (
+        Index("ix_order_product_archive_product_id", "product_id"),
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+    order: Mapped["ArchivedOrder"] = relationship(back_populates="order_products")
+    product: Mapped["Product"] = relationship()
+
+
 class Product(Base):
     __tablename__ = "products"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     product_name: Mapped[str] = mapped_column(String(100), nullable=False)
     price: Mapped[float] = mapped_column(Float)
+    # Units on hand; NULL means stock isn't tracked. Only changed with the
+    # conditional UPDATEs in inventory.py
+    stock: Mapped[int] = mapped_column(Integer, nullable=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    # Bumped only when product_name or price change, the fields order bodies
+    # embed: order ETags fold it in, so selling stock doesn't change them
+    details_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default="1"
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, insert_default=func.now(), onupdate=func.now()
+    )
+
+    __table_args__ = (
+        # Backs GET /products/search on MySQL (see search.py)
+        Index(
+            "ix_products_product_name_fulltext", "product_name", mysql_prefix="FULLTEXT"
+        ).ddl_if(dialect="mysql"),
+        # The in-memory search index's refresh reads rows changed since it
+        # last looked
+        Index("ix_products_updated_at", "updated_at"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
     # Many-to-many through OrderProduct
     order_products: Mapped[List["OrderProduct"]] = relationship(
         back_populates="product"
     )
+
+
+class ProductDeletion(Base):
+    """
+    A deleted product, written with the delete: deletes leave no row for
+    the in-memory search indexes of other workers (search.py) to notice.
+    """
+
+    __tablename__ = "product_deletions"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    product_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, insert_default=func.now(), index=True
+    )
+
+
+class IdempotencyKey(Base):
+    """The stored outcome of a request sent with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # sha256 of method, path and body; a reused key must match it
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # NULL while the first request is still running
+    status_code: Mapped[int] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[bytes] = mapped_column(LargeBinary(2**24 - 1), nullable=True)
+    content_type: Mapped[str] = mapped_column(String(100), nullable=True)
+    etag: Mapped[str] = mapped_column(String(255), nullable=True)
+    # Lease of the request running it; past it another request may take over
+    locked_until: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class Job(Base):
+    """
+    A queued side effect, inserted in the same transaction as the change
+    that caused it (transactional outbox), so it exists exactly when that
+    change was committed.
+    """
+
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # JSON
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Not picked up before this; pushed back after each failure
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    # Lease of the worker running it; past it another worker may take it
+    locked_until: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class DeadJob(Base):
+    """A job that failed JOB_MAX_ATTEMPTS times, kept for inspection or requeueing."""
+
+    __tablename__ = "dead_jobs"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # jobs.id it had; SQLite may hand out the same id again later
+    job_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    failed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -0,0 +1,90 @@
+"""
+Set-based writes to order lines keyed on (order_id, product_id), so
+changing a line never loads the order's other lines.
+"""
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import db, OrderProduct
+
+
+def upsert_lines(order_id, quantities):
+    """
+    Insert or overwrite the lines {product_id: quantity} of an order with
+    one executemany upsert statement.
+    """
+    if not quantities:
+        return
+    rows = [
+        {"order_id": order_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ]
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "mysql":
+        stmt = mysql.insert(OrderProduct)
+        stmt = stmt.on_duplicate_key_update(quantity=stmt.inserted.quantity)
+    elif dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(OrderProduct)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OrderProduct.order_id, OrderProduct.product_id],
+            set_={"quantity": stmt.excluded.quantity},
+        )
+    else:
+        _update_then_insert(order_id, rows)
+        return
+
+    db.session.execute(stmt, rows)
+
+
+def line_quantities(order_id, product_ids):
+    """
+    {product_id: quantity} of the given lines that exist, locked until the
+    transaction ends so their stock can be adjusted by the difference.
+    """
+    if not product_ids:
+        return {}
+    stmt = (
+        select(OrderProduct.product_id, OrderProduct.quantity)
+        .where(
+            OrderProduct.order_id == order_id,
+            OrderProduct.product_id.in_(product_ids),
+        )
+        .with_for_update()
+    )
+    return dict(db.session.execute(stmt).all())
+
+
+def delete_lines(order_id, product_ids):
+    """Delete the given lines of an order; returns how many existed."""
+    if not product_ids:
+        return 0
+    result = db.session.execute(
+        delete(OrderProduct)
+        .where(
+            OrderProduct.order_id == order_id,
+            OrderProduct.product_id.in_(product_ids),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _update_then_insert(order_id, rows):
+    # Databases without an upsert: one SELECT to split the rows, then an
+    # executemany UPDATE by primary key and an executemany INSERT
+    existing = set(
+        db.session.execute(
+            select(OrderProduct.product_id).where(
+                OrderProduct.order_id == order_id,
+                OrderProduct.product_id.in_([row["product_id"] for row in rows]),
+            )
+        ).scalars()
+    )
+    updates = [row for row in rows if row["product_id"] in existing]
+    inserts = [row for row in rows if row["product_id"] not in existing]
+    if updates:
+        db.session.execute(update(OrderProduct), updates)
+    if inserts:
+        db.session.execute(insert(OrderProduct), inserts)
@@ -0,0 +1,141 @@
+"""
+Keeps order_summary in step with orders and order_product.
+
+Every write to order lines calls one of these in the same transaction:
+new orders get their row from one INSERT ... SELECT over their lines,
+line changes apply the difference with one UPDATE of the order's row,
+and price changes adjust the totals of the orders containing the product.
+rebuild() recomputes every row from the lines and repairs any drift.
+"""
+from sqlalchemy import func, insert, select, update
+
+from models import db, Order, OrderProduct, OrderSummary, Product
+
+COLUMNS = ["order_id", "user_id", "order_date", "line_count", "item_count", "total"]
+DEFAULT_BATCH_SIZE = 1000
+
+
+def summary_select():
+    """Order rows computed from their lines, in COLUMNS order."""
+    return (
+        select(
+            Order.id,
+            Order.user_id,
+            Order.order_date,
+            func.count(OrderProduct.product_id),
+            func.coalesce(func.sum(OrderProduct.quantity), 0),
+            func.round(func.coalesce(func.sum(OrderProduct.quantity * Product.price), 0), 2),
+        )
+        .select_from(Order)
+        .outerjoin(OrderProduct, OrderProduct.order_id == Order.id)
+        .outerjoin(Product, OrderProduct.product_id == Product.id)
+        .group_by(Order.id, Order.user_id, Order.order_date)
+    )
+
+
+def summarize_orders(order_ids, session=None):
+    """
+    Insert the rows of new orders, after their lines were flushed.
+    `session` defaults to db.session (async_app.py passes its own).
+    """
+    if not order_ids:
+        return
+    (session or db.session).execute(
+        insert(OrderSummary).from_select(
+            COLUMNS, summary_select().where(Order.id.in_(order_ids))
+        )
+    )
+
+
+def apply_line_changes(order_id, changes):
+    """
+    Apply {product_id: (old quantity, new quantity)} to the order's row,
+    0 meaning no line. One price lookup and one UPDATE, whatever the
+    order size.
+    """
+    changes = {pid: (old, new) for pid, (old, new) in changes.items() if old != new}
+    if not changes:
+        return
+    prices = dict(
+        db.session.execute(
+            select(Product.id, Product.price).where(Product.id.in_(changes))
+        ).all()
+    )
+    lines = sum((new > 0) - (old > 0) for old, new in changes.values())
+    items = sum(new - old for old, new in changes.values())
+    total = sum((new - old) * prices[pid] for pid, (old, new) in changes.items())
+
+    db.session.execute(
+        update(OrderSummary)
+        .where(OrderSummary.order_id == order_id)
+        .values(
+            line_count=OrderSummary.line_count + lines,
+            item_count=OrderSummary.item_count + items,
+            total=func.round(OrderSummary.total + total, 2),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reprice_product(product_id, difference):
+    """Move the totals of every order containing the product by its price change."""
+    quantity = (
+        select(OrderProduct.quantity)
+        .where(
+            OrderProduct.order_id == OrderSummary.order_id,
+            OrderProduct.product_id == product_id,
+        )
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(OrderSummary)
+        .where(
+            OrderSummary.order_id.in_(
+                select(OrderProduct.order_id).where(OrderProduct.product_id == product_id)
+            )
+        )
+        .values(total=func.round(OrderSummary.total + quantity * difference, 2))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Recompute every row from the lines, `batch_size` orders per
+    transaction, and fix the ones that differ. Returns (checked, repaired).
+    """
+    checked = repaired = 0
+    after = 0
+    while True:
+        fresh = {
+            row[0]: row
+            for row in db.session.execute(
+                summary_select().where(Order.id > after).order_by(Order.id).limit(batch_size)
+            )
+        }
+        # Rows whose order is gone, in this batch's id range
+        stmt = select(OrderSummary).where(OrderSummary.order_id > after)
+        if len(fresh) == batch_size:
+            stmt = stmt.where(OrderSummary.order_id <= max(fresh))
+        stored = {row.order_id: row for row in db.session.execute(stmt).scalars()}
+
+        for order_id in stored.keys() - fresh.keys():
+            db.session.delete(stored[order_id])
+            repaired += 1
+        for order_id, row in fresh.items():
+            values = dict(zip(COLUMNS, row))
+            summary = stored.get(order_id)
+            if summary is None:
+                db.session.add(OrderSummary(**values))
+                repaired += 1
+            elif any(getattr(summary, key) != value for key, value in values.items()):
+                for key, value in values.items():
+                    setattr(summary, key, value)
+                repaired += 1
+        db.session.commit()
+        db.session.expunge_all()
+
+        checked += len(fresh)
+        if len(fresh) < batch_size:
+            return checked, repaired
+        after = max(fresh)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """Counters for one engine's connection pool."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def incr(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.total_wait * 1000, 3),
+                "wait_ms_avg": (
+                    round(self.total_wait * 1000 / self.checkouts, 3)
+                    if self.checkouts
+                    else 0.0
+                ),
+                "wait_ms_max": round(self.max_wait * 1000, 3),
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts wait, when the pool grows
+    past pool_size into overflow, checkout timeouts, new connections and
+    invalidated (stale) connections.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        # recreate() passes the old pool's listeners along in _dispatch
+        if "_dispatch" not in kwargs:
+            metrics = self.metrics
+            event.listen(self, "connect", lambda *a: metrics.incr("connects"))
+            event.listen(self, "invalidate", lambda *a: metrics.incr("invalidations"))
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.incr("timeouts")
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+    def _inc_overflow(self):
+        # overflow() is negative while the pool is below pool_size
+        grew = super()._inc_overflow()
+        if grew and self.overflow() > 0:
+            self.metrics.incr("overflow_events")
+        return grew
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, keep the counters running
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def pool_stats(engine):
+    """Snapshot of an engine's pool for the /metrics endpoint."""
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, MeteredQueuePool):
+        stats.update(pool.metrics.as_dict())
+    return stats
@@ -0,0 +1,208 @@
+"""
+Read replicas for GET requests.
+
+With SQLALCHEMY_REPLICA_URIS set (DATABASE_REPLICA_URLS in the
+environment, comma separated) the replicas become the binds replica_1,
+replica_2, ... and RoutingSession sends a query to one only when all of
+these hold:
+
+- the request is a GET or HEAD and its client hasn't written lately,
+- the statement is a SELECT without FOR UPDATE and isn't part of a flush,
+- the session hasn't written yet in this request.
+
+Everything else, including CLI commands and background jobs, uses the
+primary (SQLALCHEMY_DATABASE_URI).
+
+A request reads from one replica throughout, picked round robin among the
+healthy ones. A replica is probed with SELECT 1 when picked if its last
+check is older than REPLICA_CHECK_INTERVAL seconds, and sits out for
+REPLICA_RETRY_AFTER seconds when a probe or a query fails to connect, so
+an outage costs at most the requests already using it. With no healthy
+replica, reads go to the primary.
+
+Replicas lag behind the primary. A successful write sets the read_primary
+cookie for REPLICA_STICKY_SECONDS, and that client's reads go to the
+primary until it expires, so it sees its own writes.
+"""
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, select
+from sqlalchemy.sql import Select
+
+from pool_metrics import pool_stats
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "read_primary"
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    """db.session class that sends a GET request's reads to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get("read_from_replica"):
+            if self._flushing or not _is_read(clause):
+                # Stay on the primary for the rest of the request
+                g.read_from_replica = False
+            else:
+                engine = read_replicas.engine_for_request()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_read(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class Replica:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.down_until = 0.0
+        self.checked_at = None
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+
+    def as_dict(self, now):
+        return {
+            "name": self.name,
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.down_until <= now,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "pool": pool_stats(self.engine),
+        }
+
+
+class ReadReplicas:
+    """
+    Picks the replica for each GET request and tracks replica health.
+
+    Config:
+    SQLALCHEMY_REPLICA_URIS  database URIs of the replicas (default none)
+    REPLICA_CHECK_INTERVAL   seconds between probes of a replica (default 10)
+    REPLICA_RETRY_AFTER      seconds a failed replica is skipped (default 30)
+    REPLICA_STICKY_SECONDS   seconds a client reads from the primary after
+                             a write (default 5, 0 disables the cookie)
+    """
+
+    def __init__(self):
+        self.replicas = []
+        self.lock = threading.Lock()
+        self.next = 0
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("REPLICA_CHECK_INTERVAL", 10)
+        app.config.setdefault("REPLICA_RETRY_AFTER", 30)
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+
+        with app.app_context():
+            engines = app.extensions["sqlalchemy"].engines
+            self.replicas = [
+                Replica(key, engine)
+                for key, engine in engines.items()
+                if key is not None and key.startswith("replica_")
+            ]
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self._on_error(replica, app))
+
+        if self.replicas:
+            app.before_request(self.route_request)
+            app.after_request(self.remember_write)
+
+    def route_request(self):
+        g.read_from_replica = request.method in READ_METHODS and not _reads_primary()
+
+    def remember_write(self, response):
+        seconds = current_app.config["REPLICA_STICKY_SECONDS"]
+        if seconds and request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(
+                COOKIE,
+                str(int(time.time() + seconds)),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def engine_for_request(self):
+        """The request's replica engine, None to use the primary."""
+        if "replica" not in g:
+            g.replica = self.pick()
+        return g.replica.engine if g.replica is not None else None
+
+    def pick(self):
+        """Next healthy replica in round robin order, or None."""
+        with self.lock:
+            start = self.next
+            self.next = (self.next + 1) % len(self.replicas)
+        now = time.monotonic()
+        interval = current_app.config["REPLICA_CHECK_INTERVAL"]
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.down_until > now:
+                continue
+            if replica.checked_at is None or now - replica.checked_at >= interval:
+                if not self.probe(replica):
+                    continue
+            with self.lock:
+                replica.requests += 1
+            return replica
+        return None
+
+    def probe(self, replica):
+        replica.checked_at = time.monotonic()
+        try:
+            with replica.engine.connect() as conn:
+                conn.execute(select(1))
+        except exc.DBAPIError as e:
+            # handle_error has already marked it down
+            if replica.down_until <= time.monotonic():
+                self.mark_down(replica, e, current_app.config["REPLICA_RETRY_AFTER"])
+            return False
+        return True
+
+    def mark_down(self, replica, error, retry_after):
+        with self.lock:
+            replica.down_until = time.monotonic() + retry_after
+            replica.checked_at = None  # probe again before it's used
+            replica.failures += 1
+            replica.last_error = str(error).splitlines()[0]
+        logger.warning(
+            "Replica %s unavailable for %ss: %s", replica.name, retry_after, replica.last_error
+        )
+
+    def _on_error(self, replica, app):
+        def on_error(context):
+            if context.is_disconnect or isinstance(
+                context.sqlalchemy_exception, exc.OperationalError
+            ):
+                self.mark_down(
+                    replica, context.original_exception, app.config["REPLICA_RETRY_AFTER"]
+                )
+
+        return on_error
+
+    def stats(self):
+        now = time.monotonic()
+        return [replica.as_dict(now) for replica in self.replicas]
+
+
+def _reads_primary():
+    # The cookie holds the time its write stickiness ends
+    try:
+        return float(request.cookies.get(COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+read_replicas = ReadReplicas()
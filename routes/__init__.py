@@ -4,10 +4,14 @@ from flask import Blueprint
 from .users import users_bp
 from .orders import orders_bp
 from .products import products_bp
+from .reports import reports_bp
+from .metrics import metrics_bp
 
 # Collect them in a list (easy to expand later)
 all_blueprints = [
     users_bp,
     orders_bp,
-    products_bp
+    products_bp,
+    reports_bp,
+    metrics_bp,
 ]
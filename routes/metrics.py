@@ -0,0 +1,58 @@
+# routes/metrics.py
+import time
+
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+from cache import product_cache
+from instrumentation import request_metrics
+from models import db
+from pool_metrics import pool_stats
+from replicas import read_replicas
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Connection pool, replica and cache counters for this worker process."""
+    return (
+        jsonify(
+            {
+                "db_pool": pool_stats(db.engine),
+                "replicas": read_replicas.stats(),
+                "product_cache": product_cache.stats(),
+            }
+        ),
+        200,
+    )
+
+
+@metrics_bp.route("/metrics/requests", methods=["GET"])
+def get_request_metrics():
+    """
+    Per endpoint: request count, a duration histogram (each bucket counts
+    the requests slower than the previous bound and at most le_ms) and
+    average statements, SQL time, schema load/dump time and response size.
+    """
+    return jsonify(request_metrics.stats()), 200
+
+
+@metrics_bp.route("/health", methods=["GET"])
+def health():
+    """
+    Round trip to the primary database; 503 when it can't be reached.
+    Replicas are listed with their health but don't affect the status.
+    """
+    start = time.perf_counter()
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+    elapsed = round((time.perf_counter() - start) * 1000, 3)
+    replicas = [
+        {"name": r["name"], "healthy": r["healthy"], "last_error": r["last_error"]}
+        for r in read_replicas.stats()
+    ]
+    return jsonify({"status": "ok", "db_ms": elapsed, "replicas": replicas}), 200
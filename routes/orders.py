@@ -1,8 +1,33 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from marshmallow import ValidationError
-from models import db, Order, User, Product, OrderProduct
-from schemas import OrderProductSchema, OrderSchema, order_schema, orders_schema
+from models import db, ArchivedOrder, Order, OrderSummary, User
+from schemas import (
+    OrderLinesPatchSchema,
+    OrderProductSchema,
+    OrderSchema,
+    archived_orders_schema,
+    order_schema,
+    order_summaries_schema,
+    orders_schema,
+)
 from sqlalchemy import select
+import bulk
+from cache import product_cache
+from idempotency import idempotent, on_commit
+from checkout import place_order
+from inventory import OutOfStock, adjust, restock_orders
+from order_lines import delete_lines, line_quantities, upsert_lines
+from order_summary import apply_line_changes
+from conditional import (
+    not_modified,
+    order_etag,
+    precondition_failed,
+    retry_stale,
+    with_validators,
+)
+from fieldsets import query_options, requested_schema
+from pagination import paginate
+from serializers import compile_schema, dump_one, fast_serializer
 
 orders_bp = Blueprint("orders", __name__)
 
@@ -20,7 +45,36 @@ orders_bp = Blueprint("orders", __name__)
 #     return order_schema.jsonify(new_order), 201
 
 
+def load_order(order_id, schema=order_schema, model=Order):
+    """
+    Fetch an order with everything `schema` dumps eagerly loaded;
+    model=ArchivedOrder reads the archive.
+    """
+    stmt = (
+        select(model)
+        .where(model.id == order_id)
+        .options(*query_options(schema, model))
+    )
+    return db.session.execute(stmt).scalar_one_or_none()
+
+
+def out_of_stock(e):
+    db.session.rollback()
+    return jsonify({"message": str(e), "shortages": e.shortages}), 409
+
+
+def invalidate_products(product_ids):
+    # Stock changes bump the product's version, drop the stale cache
+    # entries once that is committed (see idempotency.on_commit)
+    def invalidate():
+        for product_id in product_ids:
+            product_cache.invalidate(product_id)
+
+    on_commit(invalidate)
+
+
 @orders_bp.route("/users/<int:user_id>/orders", methods=["POST"])
+@idempotent
 def create_order_with_product(user_id):
     """
     Create a new order for a user with products.
@@ -31,6 +85,7 @@ def create_order_with_product(user_id):
             {"product_id": 7, "quantity": 1}
         ]
     }
+    Returns 409 with the shortages when a product hasn't enough stock.
     """
     user = db.session.get(User, user_id)
     if not user:
@@ -42,29 +97,61 @@ def create_order_with_product(user_id):
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    # Create new Order instance
-    new_order = Order(user=user)
-    db.session.add(new_order)
-
-    # Attach OrderProducts to the new order
-    for op in order_data.order_products:
-        product = db.session.get(Product, op.product_id)
-        if not product:
-            return (
-                jsonify({"message": f"Product id {op.product_id} does not exist"}),
-                400,
-            )
-
-        op.order = new_order  # link each OrderProduct to the new order
-        db.session.add(op)
+    # Validation already resolved every product in one query (op.product),
+    # so the line items can be attached as they are
+    try:
+        new_order, changed = place_order(user, order_data.order_products)
+    except OutOfStock as e:
+        return out_of_stock(e)
 
     db.session.commit()
+    invalidate_products(changed)
 
     # Return the new order with nested products, stripped values, and user info
-    return order_schema.jsonify(new_order), 201
+    return order_schema.jsonify(load_order(new_order.id)), 201
+
+
+@orders_bp.route("/orders/bulk", methods=["POST"])
+def create_orders_bulk():
+    """
+    Creates many orders in one request.
+    Body: a JSON array, or NDJSON with Content-Type: application/x-ndjson
+    [
+        {"user_id": 1, "products": [{"product_id": 5, "quantity": 2}]},
+        {"user_id": 2, "products": [{"product_id": 7}]}
+    ]
+    Orders are validated and inserted in transactions of
+    BULK_ORDER_BATCH_SIZE (override with ?batch_size=).
+    Returns 201 when every order was created, 207 with per-item errors otherwise.
+    """
+    try:
+        batch_size = int(
+            request.args.get(
+                "batch_size",
+                current_app.config.get("BULK_ORDER_BATCH_SIZE", bulk.DEFAULT_BATCH_SIZE),
+            )
+        )
+    except ValueError:
+        return jsonify({"message": "batch_size must be an integer"}), 400
+    if batch_size < 1:
+        return jsonify({"message": "batch_size must be at least 1"}), 400
+
+    try:
+        results = bulk.ingest(bulk.iter_payload(request), batch_size)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    created = sum(1 for r in results if r["status"] == "created")
+    failed = len(results) - created
+    return (
+        jsonify({"created": created, "failed": failed, "results": results}),
+        207 if failed else 201,
+    )
 
 
 @orders_bp.route("/orders/<int:order_id>/products", methods=["PUT"])
+@idempotent
+@retry_stale
 def add_product_to_order(order_id):
     """
     Adds or updates a product in an order.
@@ -78,58 +165,205 @@ def add_product_to_order(order_id):
     if not order:
         return jsonify({"message": "Invalid order id"}), 400
 
+    # If-Match: <etag from GET /orders/<id>> guards against concurrent edits
+    failed = precondition_failed(lambda: order_etag(order_id))
+    if failed:
+        return failed
+
     try:
         # Validate and deserialize input
         data = OrderProductSchema().load(request.json)
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    product = db.session.get(Product, data.product_id)
+    product = product_cache.get_product(db.session, data.product_id)
     if not product:
         return jsonify({"message": f"Product id {data.product_id} does not exist"}), 400
 
-    # Check if the product already exists in the order
-    order_product = next(
-        (op for op in order.order_products if op.product_id == data.product_id), None
+    # Stock moves by the difference to the current quantity
+    current = line_quantities(order_id, [data.product_id]).get(data.product_id, 0)
+    try:
+        changed = adjust({data.product_id: data.quantity - current})
+    except OutOfStock as e:
+        return out_of_stock(e)
+
+    # One upsert keyed on (order_id, product_id), the order's other lines
+    # are never loaded
+    upsert_lines(order_id, {data.product_id: data.quantity})
+    apply_line_changes(order_id, {data.product_id: (current, data.quantity)})
+    # Built before commit() expires the product
+    message = f"{data.quantity} {product.product_name}{'s' if data.quantity > 1 else ''} were added to order id {order_id}."
+
+    # Line changes don't touch the orders row, bump its version explicitly
+    order.version = order.version + 1
+    db.session.commit()
+    invalidate_products(changed)
+
+    return with_validators(
+        (jsonify({"message": message}), 200),
+        order_etag(order_id),
     )
 
-    if order_product:
-        # Update quantity
-        order_product.quantity = data.quantity
-    else:
-        # Create new OrderProduct
-        order_product = OrderProduct(
-            order=order, product=product, quantity=data.quantity
+
+@orders_bp.route("/orders/<int:order_id>/products", methods=["PATCH"])
+@idempotent
+@retry_stale
+def update_order_products(order_id):
+    """
+    Applies many line changes in one request, quantity 0 removes a line.
+    Expected JSON:
+    {
+        "products": [
+            {"product_id": 5, "quantity": 3},
+            {"product_id": 7, "quantity": 0}
+        ]
+    }
+    """
+    order = db.session.get(Order, order_id)
+    if not order:
+        return jsonify({"message": "Invalid order id"}), 400
+
+    failed = precondition_failed(lambda: order_etag(order_id))
+    if failed:
+        return failed
+
+    try:
+        changes = OrderLinesPatchSchema().load(request.json)["products"]
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    current = line_quantities(order_id, [c["product_id"] for c in changes])
+    try:
+        changed = adjust(
+            {c["product_id"]: c["quantity"] - current.get(c["product_id"], 0) for c in changes}
         )
-        db.session.add(order_product)
+    except OutOfStock as e:
+        return out_of_stock(e)
+
+    # One executemany upsert and one DELETE ... IN, whatever the order size
+    quantities = {c["product_id"]: c["quantity"] for c in changes if c["quantity"]}
+    upsert_lines(order_id, quantities)
+    removed = delete_lines(
+        order_id, [c["product_id"] for c in changes if not c["quantity"]]
+    )
+    apply_line_changes(
+        order_id,
+        {c["product_id"]: (current.get(c["product_id"], 0), c["quantity"]) for c in changes},
+    )
 
+    order.version = order.version + 1
     db.session.commit()
+    invalidate_products(changed)
 
-    return (
-        jsonify(
-            {
-                "message": f"{order_product.quantity} {product.product_name}{'s' if order_product.quantity > 1 else ''} were added to order id {order.id}."
-            }
+    return with_validators(
+        (
+            jsonify(
+                {
+                    "message": f"Order id {order_id} was updated.",
+                    "updated": len(quantities),
+                    "removed": removed,
+                }
+            ),
+            200,
         ),
-        200,
+        order_etag(order_id),
     )
 
 
 @orders_bp.route("/orders", methods=["GET"])
 def get_orders():
-    orders = db.session.execute(select(Order)).scalars().all()
-    return orders_schema.jsonify(orders), 200
+    """
+    Lists orders one page at a time.
+    Query params: ?limit=50&after=<next_cursor>, ?format=ndjson to stream,
+    ?fields=id,order_date,user.name to trim the items (see fieldsets.py).
+    ?view=summary lists line count, item count and total per order instead
+    of the lines, read from order_summary.
+    """
+    summary = request.args.get("view") == "summary"
+    try:
+        schema = requested_schema(order_summaries_schema if summary else orders_schema)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if summary:
+        stmt = select(OrderSummary).options(*query_options(schema))
+        return paginate(stmt, OrderSummary.order_id, schema)
+
+    stmt = select(Order).options(*query_options(schema))
+    return paginate(stmt, Order.id, schema)
+
+
+@orders_bp.route("/users/<int:user_id>/orders", methods=["GET"])
+def get_user_orders(user_id):
+    """
+    A user's order history from order_summary, oldest first.
+    Query params: ?limit=50&after=<next_cursor>, ?format=ndjson to stream,
+    ?fields=order_id,total
+    ?archived=1 lists their archived orders instead (see archive.py), in
+    the same shape plus archived_at.
+    """
+    archived = request.args.get("archived") in ("1", "true")
+    try:
+        schema = requested_schema(
+            archived_orders_schema if archived else order_summaries_schema
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if db.session.get(User, user_id) is None:
+        return jsonify({"message": "Invalid user id"}), 404
+
+    if archived:
+        stmt = (
+            select(ArchivedOrder)
+            .where(ArchivedOrder.user_id == user_id)
+            .options(*query_options(schema))
+        )
+        return paginate(stmt, ArchivedOrder.id, schema)
+
+    stmt = (
+        select(OrderSummary)
+        .where(OrderSummary.user_id == user_id)
+        .options(*query_options(schema))
+    )
+    return paginate(stmt, OrderSummary.order_id, schema)
 
 
 @orders_bp.route("/orders/<int:order_id>", methods=["GET"])
 def get_order(order_id):
-    order = db.session.get(Order, order_id)
-    if not order:
+    # ?fields=id,order_date,user.name to trim the response (see fieldsets.py)
+    try:
+        schema = requested_schema(order_schema)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # The ETag comes from one aggregate query, so a 304 skips loading the order
+    model = Order
+    etag = order_etag(order_id)
+    if etag is None:
+        # Not in orders: it may have been archived
+        model = ArchivedOrder
+        etag = order_etag(order_id, archived=True)
+    if etag is None:
         return jsonify({"message": "Invalid order id"}), 400
-    return order_schema.jsonify(order), 200
+
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    compiled = fast_serializer(schema)
+    if compiled is not None:
+        if model is not Order:
+            compiled = compile_schema(schema, model)
+        body = jsonify(dump_one(compiled, model.id, order_id))
+    else:
+        body = schema.jsonify(load_order(order_id, schema, model))
+    return with_validators((body, 200), etag)
 
 
 @orders_bp.route("/orders/<int:order_id>/products", methods=["DELETE"])
+@idempotent
+@retry_stale
 def delete_product_from_order(order_id):
     """
     Deletes a product from an order.
@@ -143,37 +377,54 @@ def delete_product_from_order(order_id):
     if not order:
         return jsonify({"message": "Invalid order id"}), 400
 
+    failed = precondition_failed(lambda: order_etag(order_id))
+    if failed:
+        return failed
+
     try:
         data = OrderProductSchema().load(request.json)
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    order_product = next(
-        (op for op in order.order_products if op.product_id == data.product_id), None
-    )
-
-    if not order_product:
+    current = line_quantities(order_id, [data.product_id])
+    if not current:
         return (
             jsonify(
-                {"message": f"Product id {data.product_id} is not in order {order.id}"}
+                {"message": f"Product id {data.product_id} is not in order {order_id}"}
             ),
             400,
         )
+    changed = adjust({data.product_id: -current[data.product_id]})
+    delete_lines(order_id, [data.product_id])
+    apply_line_changes(order_id, {data.product_id: (current[data.product_id], 0)})
 
-    db.session.delete(order_product)
+    order.version = order.version + 1
     db.session.commit()
+    invalidate_products(changed)
 
-    # Return the updated order with nested products and user
-    return order_schema.jsonify(order), 200
+    return with_validators(
+        (
+            jsonify(
+                {"message": f"Product id {data.product_id} was removed from order id {order_id}."}
+            ),
+            200,
+        ),
+        order_etag(order_id),
+    )
 
 
 @orders_bp.route("/orders/<int:order_id>", methods=["DELETE"])
+@retry_stale
 def delete_order(order_id):
     order = db.session.get(Order, order_id)
 
     if not order:
         return jsonify({"message": "Order not found"}), 404
 
+    # The lines and the summary go with it through ON DELETE CASCADE
+    changed = restock_orders([order_id])
     db.session.delete(order)
     db.session.commit()
+    invalidate_products(changed)
     return jsonify({"message": f"Successfully deleted order {order.id}"}), 200
+
@@ -2,9 +2,24 @@
 from flask import Blueprint, request, jsonify
 from marshmallow import ValidationError
 from sqlalchemy import select
-
+from sqlalchemy.orm.exc import StaleDataError
+
+from cache import product_cache
+from conditional import (
+    content_etag,
+    not_modified,
+    precondition_failed,
+    retry_stale,
+    row_etag,
+    with_validators,
+)
+from fieldsets import query_options, requested_schema, variant_key
+from inventory import OutOfStock, set_stock
 from models import db, Product
+from order_summary import reprice_product
+from pagination import fetch_page, page_args, paginate, wants_ndjson
 from schemas import product_schema, products_schema
+from search import product_search, tokenize
 
 products_bp = Blueprint("products", __name__)
 
@@ -19,45 +34,154 @@ def create_product():
 
     db.session.add(product_data)
     db.session.commit()
+    product_cache.invalidate()
+    product_search.index_product(product_data)
 
     return product_schema.jsonify(product_data), 201
 
 
 @products_bp.route("/products", methods=["GET"])
 def get_products():
-    products = db.session.execute(select(Product)).scalars().all()
-    return products_schema.jsonify(products), 200
+    # ?limit=50&after=<next_cursor>, ?format=ndjson to stream,
+    # ?fields=id,price (see fieldsets.py)
+    try:
+        schema = requested_schema(products_schema)
+        limit, after = page_args()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if wants_ndjson():
+        return paginate(select(Product).options(*query_options(schema)), Product.id, schema)
+
+    stmt = (
+        select(Product)
+        .where(Product.id > after)
+        .order_by(Product.id)
+        .options(*query_options(schema))
+    )
+
+    def load_page():
+        body = fetch_page(stmt, Product.id, schema, limit)
+        return {"etag": content_etag(body), "body": body}
+
+    page = product_cache.get_page(after, limit, load_page, variant_key(schema))
+    cached = not_modified(page["etag"])
+    if cached:
+        return cached
+    return with_validators((jsonify(page["body"]), 200), page["etag"])
+
+
+@products_bp.route("/products/search", methods=["GET"])
+def search_products():
+    """
+    Products with a word starting with every search term, ordered by id.
+    Query params: ?q=red sho&min_price=10&max_price=50&limit=50&after=<next_cursor>,
+    ?fields=id,product_name
+    """
+    terms = tokenize(request.args.get("q", ""))
+    if not terms:
+        return jsonify({"message": "q must contain at least one word"}), 400
+
+    try:
+        schema = requested_schema(products_schema)
+        limit, after = page_args()
+        min_price = price_arg("min_price")
+        max_price = price_arg("max_price")
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # One extra row tells fetch_page whether there is a next page
+    stmt = product_search.statement(terms, min_price, max_price, after, limit + 1)
+    stmt = stmt.options(*query_options(schema))
+    return jsonify(fetch_page(stmt, Product.id, schema, limit)), 200
+
+
+def price_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+@products_bp.route("/products/cache", methods=["GET"])
+def get_product_cache_stats():
+    # Hit/miss/eviction counters of this worker's product cache
+    return jsonify(product_cache.stats()), 200
 
 
 @products_bp.route("/products/<int:product_id>", methods=["GET"])
 def get_product(product_id):
-    product = db.session.get(Product, product_id)
+    # ?fields=id,price (see fieldsets.py); the row comes whole from the cache
+    try:
+        schema = requested_schema(product_schema)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    product = product_cache.get_product(db.session, product_id)
 
     if not product:
         return jsonify({"message": "Invalid product id"}), 404
-    return product_schema.jsonify(product), 200
+
+    etag = row_etag(product)
+    cached = not_modified(etag, product.updated_at)
+    if cached:
+        return cached
+    return with_validators(
+        (schema.jsonify(product), 200), etag, product.updated_at
+    )
 
 
 @products_bp.route("/products/<int:product_id>", methods=["PUT"])
+@retry_stale
 def update_product(product_id):
     product = db.session.get(Product, product_id)
     if not product:
         return jsonify({"message": "Invalid product id"}), 400
 
+    # If-Match: <etag> makes the update conditional on the version the client saw
+    failed = precondition_failed(row_etag(product))
+    if failed:
+        return failed
+
     try:
         # partial=True allows updating only some fields
         product_data = product_schema.load(request.json, partial=True)
     except ValidationError as e:
         return jsonify(e.messages), 400
 
-    # Update only provided fields
+    old_price = product.price
+    old_name = product.product_name
+    old_stock = product.stock
+    # Update only provided fields, stock below
     for field in ["product_name", "price"]:
         value = getattr(product_data, field, None)
         if value is not None:
             setattr(product, field, value)
+    if product.price != old_price or product.product_name != old_name:
+        # Orders show these, see Product.details_version
+        product.details_version = product.details_version + 1
 
     try:
+        if product.price != old_price:
+            # Order totals are at current prices. Its UPDATE autoflushes
+            # the product, so a concurrent change fails here already
+            reprice_product(product_id, product.price - old_price)
+        stock = getattr(product_data, "stock", None)
+        if stock is not None and stock != old_stock:
+            # Flushed first: set_stock bumps the version this UPDATE checks
+            db.session.flush()
+            set_stock(product_id, old_stock, stock)
+            db.session.expire(product)
         db.session.commit()
+    except OutOfStock as e:
+        db.session.rollback()
+        return jsonify({"message": str(e), "shortages": e.shortages}), 409
+    except StaleDataError:
+        # Answered or retried by retry_stale
+        raise
     except Exception as e:
         # rollback() resets the session to a clean state by:
         # Discarding all pending changes that weren’t committed.
@@ -65,17 +189,29 @@ def update_product(product_id):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-    return product_schema.jsonify(product), 200
+    product_cache.invalidate(product_id)
+    product_search.index_product(product)
+    return with_validators(
+        (product_schema.jsonify(product), 200), row_etag(product), product.updated_at
+    )
 
 
 @products_bp.route("/products/<int:product_id>", methods=["DELETE"])
+@retry_stale
 def delete_product(product_id):
     product = db.session.get(Product, product_id)
     if not product:
         return jsonify({"message": "Invalid product id"}), 400
 
+    failed = precondition_failed(row_etag(product))
+    if failed:
+        return failed
+
     db.session.delete(product)
+    product_search.record_delete(product_id)
     db.session.commit()
+    product_cache.invalidate(product_id)
+    product_search.remove_product(product_id)
     return (
         jsonify(
             {
@@ -0,0 +1,285 @@
+# routes/reports.py
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import desc, func, select, union_all
+
+from models import (
+    db,
+    ArchivedOrder,
+    ArchivedOrderProduct,
+    Order,
+    OrderProduct,
+    OrderSummary,
+    Product,
+    User,
+)
+from pagination import MAX_LIMIT, page_args
+
+reports_bp = Blueprint("reports", __name__)
+
+LINE_TOTAL = OrderProduct.quantity * Product.price
+
+
+def date_range(column=Order.order_date):
+    """
+    Read ?start= and ?end= (ISO dates or datetimes) as a half-open range
+    on `column`. A date-only end includes that whole day.
+    """
+    filters = []
+    start = request.args.get("start")
+    end = request.args.get("end")
+    try:
+        if start:
+            filters.append(column >= datetime.fromisoformat(start))
+        if end:
+            end_at = datetime.fromisoformat(end)
+            if len(end) == 10:
+                end_at += timedelta(days=1)
+            filters.append(column < end_at)
+    except ValueError:
+        raise ValueError("start and end must be ISO dates, e.g. 2025-01-31")
+    return filters
+
+
+def rank_args():
+    """?limit= and ?offset= for ranked reports, which can't use an id cursor."""
+    try:
+        limit = int(request.args.get("limit", 20))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        raise ValueError("limit and offset must be integers")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    if offset < 0:
+        raise ValueError("offset must be positive")
+    return limit, offset
+
+
+def money(value):
+    return round(float(value or 0), 2)
+
+
+def report_lines():
+    """
+    Order lines with their order's user and their value, hot and archived
+    (see archive.py), for the ranked reports: order_product at current
+    prices UNION ALL order_product_archive at the prices stored when it
+    was archived, like the order totals. Each side is filtered on
+    ?start= / ?end= before the union. Raises ValueError like date_range().
+    """
+    hot = (
+        select(
+            OrderProduct.order_id,
+            Order.user_id,
+            OrderProduct.product_id,
+            OrderProduct.quantity,
+            LINE_TOTAL.label("line_total"),
+        )
+        .join(Order, OrderProduct.order_id == Order.id)
+        .join(Product, OrderProduct.product_id == Product.id)
+        .where(*date_range(Order.order_date))
+    )
+    archived = (
+        select(
+            ArchivedOrderProduct.order_id,
+            ArchivedOrder.user_id,
+            ArchivedOrderProduct.product_id,
+            ArchivedOrderProduct.quantity,
+            ArchivedOrderProduct.quantity * ArchivedOrderProduct.unit_price,
+        )
+        .join(ArchivedOrder, ArchivedOrderProduct.order_id == ArchivedOrder.id)
+        .where(*date_range(ArchivedOrder.order_date))
+    )
+    return union_all(hot, archived).subquery("lines")
+
+
+@reports_bp.route("/orders/<int:order_id>/total", methods=["GET"])
+def get_order_total(order_id):
+    """
+    Total of a single order computed in SQL. Archived orders report the
+    totals stored when they were archived, like GET /users/<id>/orders?archived=1.
+    """
+    stmt = (
+        select(
+            func.count(OrderProduct.product_id),
+            func.sum(OrderProduct.quantity),
+            func.sum(LINE_TOTAL),
+        )
+        .join(Product, OrderProduct.product_id == Product.id)
+        .where(OrderProduct.order_id == order_id)
+    )
+    line_count, item_count, total = db.session.execute(stmt).one()
+    if not line_count and db.session.get(Order, order_id) is None:
+        archived = db.session.get(ArchivedOrder, order_id)
+        if archived is None:
+            return jsonify({"message": "Invalid order id"}), 400
+        line_count, item_count, total = (
+            archived.line_count,
+            archived.item_count,
+            archived.total,
+        )
+
+    return (
+        jsonify(
+            {
+                "order_id": order_id,
+                "line_count": line_count,
+                "item_count": item_count or 0,
+                "total": money(total),
+            }
+        ),
+        200,
+    )
+
+
+@reports_bp.route("/reports/order-totals", methods=["GET"])
+def get_order_totals():
+    """
+    Per-order totals, one page at a time.
+    Query params: ?start=2025-01-01&end=2025-01-31&user_id=3&limit=50&after=<next_cursor>
+    """
+    try:
+        limit, after = page_args()
+        hot_filters = date_range(OrderSummary.order_date)
+        archived_filters = date_range(ArchivedOrder.order_date)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    user_id = request.args.get("user_id", type=int)
+    if user_id is not None:
+        hot_filters.append(OrderSummary.user_id == user_id)
+        archived_filters.append(ArchivedOrder.user_id == user_id)
+
+    # Read from the maintained order_summary rows and the archive (its
+    # totals as of archiving), nothing is aggregated. Each side is cut to
+    # the page before the union.
+    hot = (
+        select(
+            OrderSummary.order_id.label("id"),
+            OrderSummary.user_id,
+            OrderSummary.order_date,
+            OrderSummary.line_count,
+            OrderSummary.item_count,
+            OrderSummary.total,
+        )
+        .where(OrderSummary.order_id > after, *hot_filters)
+        .order_by(OrderSummary.order_id)
+        .limit(limit + 1)
+    )
+    archived = (
+        select(
+            ArchivedOrder.id,
+            ArchivedOrder.user_id,
+            ArchivedOrder.order_date,
+            ArchivedOrder.line_count,
+            ArchivedOrder.item_count,
+            ArchivedOrder.total,
+        )
+        .where(ArchivedOrder.id > after, *archived_filters)
+        .order_by(ArchivedOrder.id)
+        .limit(limit + 1)
+    )
+    totals = union_all(hot.subquery().select(), archived.subquery().select()).subquery()
+    stmt = select(totals).order_by(totals.c.id).limit(limit + 1)
+    rows = db.session.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    items = [
+        {
+            "order_id": row.id,
+            "user_id": row.user_id,
+            "order_date": row.order_date.isoformat() if row.order_date else None,
+            "line_count": row.line_count,
+            "item_count": row.item_count,
+            "total": money(row.total),
+        }
+        for row in rows
+    ]
+    return jsonify({"items": items, "next_cursor": next_cursor}), 200
+
+
+@reports_bp.route("/reports/product-revenue", methods=["GET"])
+def get_product_revenue():
+    """
+    Revenue per product, highest first.
+    Query params: ?start=2025-01-01&end=2025-03-31&limit=20&offset=0
+    """
+    try:
+        limit, offset = rank_args()
+        lines = report_lines()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    revenue = func.sum(lines.c.line_total).label("revenue")
+    stmt = (
+        select(
+            Product.id,
+            Product.product_name,
+            func.sum(lines.c.quantity).label("units"),
+            func.count(func.distinct(lines.c.order_id)).label("orders"),
+            revenue,
+        )
+        .join(lines, lines.c.product_id == Product.id)
+        .group_by(Product.id, Product.product_name)
+        .order_by(desc(revenue), Product.id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+    items = [
+        {
+            "product_id": row.id,
+            "product_name": row.product_name,
+            "units": row.units,
+            "orders": row.orders,
+            "revenue": money(row.revenue),
+        }
+        for row in db.session.execute(stmt)
+    ]
+    return jsonify({"items": items, "limit": limit, "offset": offset}), 200
+
+
+@reports_bp.route("/reports/top-customers", methods=["GET"])
+def get_top_customers():
+    """
+    Users ranked by total spend.
+    Query params: ?start=2025-01-01&end=2025-12-31&limit=20&offset=0
+    """
+    try:
+        limit, offset = rank_args()
+        lines = report_lines()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    spend = func.sum(lines.c.line_total).label("spend")
+    stmt = (
+        select(
+            User.id,
+            User.name,
+            User.email,
+            func.count(func.distinct(lines.c.order_id)).label("orders"),
+            spend,
+        )
+        .join(lines, lines.c.user_id == User.id)
+        .group_by(User.id, User.name, User.email)
+        .order_by(desc(spend), User.id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+    items = [
+        {
+            "user_id": row.id,
+            "name": row.name,
+            "email": row.email,
+            "orders": row.orders,
+            "spend": money(row.spend),
+        }
+        for row in db.session.execute(stmt)
+    ]
+    return jsonify({"items": items, "limit": limit, "offset": offset}), 200
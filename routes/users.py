@@ -1,13 +1,31 @@
 # routes/users.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from marshmallow import ValidationError
-from sqlalchemy import select
-
-from models import db, User
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from conditional import (
+    not_modified,
+    precondition_failed,
+    retry_stale,
+    row_etag,
+    user_orders_etag,
+    with_validators,
+)
+from cache import product_cache
+from inventory import restock_orders
+from jobs import enqueue
+from models import db, Order, User
+from fieldsets import query_options, requested_schema
+from pagination import paginate
 from schemas import user_schema, users_schema
 
 users_bp = Blueprint("users", __name__)
 
+# uq_users_email enforces this, no lookup before the write
+EMAIL_TAKEN = {"email": ["Email address is already in use"]}
+
 
 @users_bp.route("/users", methods=["POST"])
 def create_user():
@@ -17,32 +35,66 @@ def create_user():
         return jsonify(e.messages), 400
 
     db.session.add(user_data)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify(EMAIL_TAKEN), 400
     return user_schema.jsonify(user_data), 201
 
 
 @users_bp.route("/users", methods=["GET"])
 def get_users():
-    users = db.session.execute(select(User)).scalars().all()
-    return users_schema.jsonify(users), 200
+    # ?limit=50&after=<next_cursor>, ?format=ndjson to stream,
+    # ?fields=id,name and ?expand=orders (see fieldsets.py)
+    try:
+        schema = requested_schema(users_schema)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    stmt = select(User).options(*query_options(schema))
+    return paginate(stmt, User.id, schema)
 
 
 @users_bp.route("/users/<int:user_id>", methods=["GET"])
 def get_user(user_id):
-    user = db.session.get(User, user_id)
+    # ?fields=id,name and ?expand=orders (see fieldsets.py)
+    try:
+        schema = requested_schema(user_schema)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    user = db.session.get(User, user_id, options=query_options(schema))
 
     if not user:
         return jsonify({"message": "Invalid user id"}), 404
-    return user_schema.jsonify(user), 200
+
+    etag = row_etag(user)
+    last_modified = user.updated_at
+    if "orders" in schema.dump_fields:
+        # The body embeds the orders: fold them into the ETag, and drop
+        # Last-Modified, which a deleted order wouldn't move
+        etag = user_orders_etag(user)
+        last_modified = None
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    return with_validators((schema.jsonify(user), 200), etag, last_modified)
 
 
 @users_bp.route("/users/<int:id>", methods=["PUT"])
+@retry_stale
 def update_user(id):
     # 1️⃣ Fetch the existing user
     user = db.session.get(User, id)
     if not user:
         return jsonify({"message": "User not found"}), 404
 
+    # If-Match: <etag> rejects the update if the user changed since it was read
+    failed = precondition_failed(row_etag(user))
+    if failed:
+        return failed
+
     # 2️⃣ Load the incoming JSON into a User instance
     try:
         # partial=True allows sending only some fields
@@ -59,22 +111,57 @@ def update_user(id):
     # 4️⃣ Commit changes
     try:
         db.session.commit()
+    except StaleDataError:
+        # Answered or retried by retry_stale
+        raise
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"errors": EMAIL_TAKEN}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
     # 5️⃣ Return the updated user
-    return user_schema.jsonify(user), 200
+    return with_validators(
+        (user_schema.jsonify(user), 200), row_etag(user), user.updated_at
+    )
 
 
 @users_bp.route("/users/<int:user_id>", methods=["DELETE"])
+@retry_stale
 def delete_user(user_id):
+    """
+    Deletes a user and their orders. The orders, lines and summaries are
+    removed by the foreign keys' ON DELETE CASCADE, nothing is loaded.
+    Users with more than USER_PURGE_THRESHOLD orders, or any with
+    ?mode=async, are deleted by a background purge_user job in batches
+    instead: 202 Accepted.
+    """
+    mode = request.args.get("mode")
+    if mode not in (None, "sync", "async"):
+        return jsonify({"message": "mode must be sync or async"}), 400
+
     user = db.session.get(User, user_id)
     if not user:
         return jsonify({"message": "Invalid user id"}), 404
 
+    orders = db.session.scalar(
+        select(func.count()).select_from(Order).where(Order.user_id == user_id)
+    )
+    if mode == "async" or (
+        mode is None and orders > current_app.config["USER_PURGE_THRESHOLD"]
+    ):
+        enqueue("purge_user", {"user_id": user_id})
+        db.session.commit()
+        message = f"Deleting user {user.id}: {user.name} and {orders} orders in the background"
+        return jsonify({"message": message}), 202
+
+    # Their orders go with them, put the ordered stock back first
+    changed = restock_orders(select(Order.id).where(Order.user_id == user_id))
     db.session.delete(user)
     db.session.commit()
+    for product_id in changed:
+        product_cache.invalidate(product_id)
     return (
         jsonify({"message": f"Successfully deleted user {user.id}: {user.name}"}),
         200,
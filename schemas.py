@@ -1,10 +1,20 @@
 from flask_marshmallow import Marshmallow
-from marshmallow import ValidationError, validates, validates_schema, pre_load
-from models import db, User, Order, Product, OrderProduct
+from marshmallow import (
+    ValidationError,
+    validate,
+    validates,
+    validates_schema,
+    pre_load,
+)
+from models import db, ArchivedOrder, User, Order, Product, OrderProduct, OrderSummary
+from cache import product_cache
+from instrumentation import TimedSchema
+from sqlalchemy.orm.attributes import set_committed_value
 import re
 
 ma = Marshmallow()
 
+EMPTY_ORDER_MESSAGE = "Order must have at least one product"
 EMAIL_REGEX = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
 session = db.session
 
@@ -16,7 +26,19 @@ def strip_strings(data):
     return data
 
 
-class OrderProductSchema(ma.SQLAlchemyAutoSchema):
+def loaded_lines(order):
+    """
+    The OrderProduct instances of a deserialized order, or [] when the
+    products field failed its own validation (its errors are already
+    reported and the nested items are left as plain dicts).
+    """
+    lines = order.get("order_products") or []
+    if not all(isinstance(op, OrderProduct) for op in lines):
+        return []
+    return lines
+
+
+class OrderProductSchema(TimedSchema, ma.SQLAlchemyAutoSchema):
     product_id = ma.Int(required=True, load_only=True)
     quantity = ma.Int(load_default=1)
     product = ma.Nested(
@@ -35,10 +57,11 @@ class OrderProductSchema(ma.SQLAlchemyAutoSchema):
             raise ValidationError("Quantity must be at least 1")
 
 
-class ProductSchema(ma.SQLAlchemyAutoSchema):
+class ProductSchema(TimedSchema, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Product
         load_instance = True
+        exclude = ("version", "details_version", "updated_at")
 
     @pre_load
     def strip_input(self, data, **kwargs):
@@ -60,9 +83,22 @@ class ProductSchema(ma.SQLAlchemyAutoSchema):
             raise ValidationError("Price must be at least 0.01")
         return value
 
+    @validates("stock")
+    def validate_stock(self, value, **kwargs):
+        if value is not None and value < 0:
+            raise ValidationError("Stock cannot be negative")
+        return value
+
 
-class OrderSchema(ma.SQLAlchemyAutoSchema):
-    order_products = ma.Nested(OrderProductSchema, many=True, data_key="products")
+class OrderSchema(TimedSchema, ma.SQLAlchemyAutoSchema):
+    order_products = ma.Nested(
+        OrderProductSchema,
+        many=True,
+        data_key="products",
+        required=True,
+        validate=validate.Length(min=1, error=EMPTY_ORDER_MESSAGE),
+        error_messages={"required": EMPTY_ORDER_MESSAGE},
+    )
     user_id = ma.Int(required=True, load_only=True)
     user = ma.Nested(
         "UserSchema", dump_only=True, only=("id", "name", "email", "address")
@@ -73,35 +109,65 @@ class OrderSchema(ma.SQLAlchemyAutoSchema):
         include_fk = True
         include_relationships = True
         load_instance = True
+        exclude = ("version", "updated_at")
 
-    @validates_schema
-    def validate_order_products(self, data, **kwargs):
-        products_list = data.get("order_products")
-        if not products_list or len(products_list) == 0:
-            raise ValidationError(
-                {"products": ["Order must have at least one product"]}
-            )
+    @validates_schema(pass_collection=True, skip_on_field_errors=False)
+    def validate_order_products(self, data, many, **kwargs):
+        # Runs once per load, so OrderSchema(many=True) resolves the products
+        # of every order in the batch from the cache plus at most one
+        # WHERE id IN (...) query for the misses
+        orders = data if many else [data]
+        products_lists = [loaded_lines(order) for order in orders]
+
+        product_ids = {
+            op.product_id
+            for products_list in products_lists
+            for op in products_list
+            if op.product_id
+        }
+        # db.session unless load() was given a session (async_app.py)
+        products = product_cache.get_products(self._session or session, product_ids)
 
-        for idx, op in enumerate(products_list):
-            product_id = getattr(op, "product_id", None)
-            if not product_id or not session.get(Product, product_id):
-                raise ValidationError(
-                    {
-                        f"products.{idx}.product_id": [
-                            f"Product id {product_id} does not exist"
-                        ]
-                    }
-                )
+        all_errors = {}
+        for order_idx, products_list in enumerate(products_lists):
+            errors = {}
+            seen = set()
+            for idx, op in enumerate(products_list):
+                product_id = getattr(op, "product_id", None)
+                if product_id not in products:
+                    errors[f"products.{idx}.product_id"] = [
+                        f"Product id {product_id} does not exist"
+                    ]
+                elif product_id in seen:
+                    errors[f"products.{idx}.product_id"] = [
+                        f"Product id {product_id} is listed more than once"
+                    ]
+                seen.add(product_id)
 
+            if errors:
+                all_errors[order_idx] = errors
+                continue
 
-class UserSchema(ma.SQLAlchemyAutoSchema):
-    orders = ma.Nested(OrderSchema, many=True, exclude=("order_products",))
+            # Hand the loaded products to the route so it never fetches them
+            # again. set_committed_value skips the Product.order_products
+            # backref, so a line that is never saved can't be cascaded in
+            # through the product.
+            for op in products_list:
+                set_committed_value(op, "product", products[op.product_id])
+
+        if all_errors:
+            raise ValidationError(all_errors if many else all_errors[0])
+
+
+class UserSchema(TimedSchema, ma.SQLAlchemyAutoSchema):
+    # Left out by user_schema/users_schema, added with ?expand=orders
+    orders = ma.Nested(OrderSchema, many=True, exclude=("order_products",), dump_only=True)
 
     class Meta:
         model = User
         include_relationships = True
         load_instance = True
-        exclude = ("orders",)
+        exclude = ("version", "updated_at")
 
     @pre_load
     def strip_input(self, data, **kwargs):
@@ -135,6 +201,71 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
         return value
 
 
+class OrderSummarySchema(TimedSchema, ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = OrderSummary
+        include_fk = True
+
+
+class ArchivedOrderSchema(TimedSchema, ma.SQLAlchemyAutoSchema):
+    # An archived order listed like an order_summary row
+    order_id = ma.Int(attribute="id", dump_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        include_fk = True
+        fields = (
+            "order_id",
+            "user_id",
+            "order_date",
+            "line_count",
+            "item_count",
+            "total",
+            "archived_at",
+        )
+
+
+class OrderLineChangeSchema(TimedSchema, ma.Schema):
+    product_id = ma.Int(required=True)
+    # 0 removes the line
+    quantity = ma.Int(
+        required=True,
+        validate=validate.Range(min=0, error="Quantity must be 0 (remove) or more"),
+    )
+
+
+class OrderLinesPatchSchema(TimedSchema, ma.Schema):
+    products = ma.Nested(
+        OrderLineChangeSchema,
+        many=True,
+        required=True,
+        validate=validate.Length(min=1, error="Send at least one product change"),
+    )
+
+    @validates_schema(skip_on_field_errors=True)
+    def validate_products(self, data, **kwargs):
+        changes = data["products"]
+        added = {c["product_id"] for c in changes if c["quantity"] > 0}
+        products = product_cache.get_products(session, added)
+
+        errors = {}
+        seen = set()
+        for idx, change in enumerate(changes):
+            product_id = change["product_id"]
+            if product_id in seen:
+                errors[f"products.{idx}.product_id"] = [
+                    f"Product id {product_id} is listed more than once"
+                ]
+            elif product_id in added and product_id not in products:
+                errors[f"products.{idx}.product_id"] = [
+                    f"Product id {product_id} does not exist"
+                ]
+            seen.add(product_id)
+
+        if errors:
+            raise ValidationError(errors)
+
+
 order_product_schema = OrderProductSchema()
 order_products_schema = OrderProductSchema(many=True)
 
@@ -144,5 +275,8 @@ products_schema = ProductSchema(many=True)
 order_schema = OrderSchema()
 orders_schema = OrderSchema(many=True)
 
-user_schema = UserSchema()
-users_schema = UserSchema(many=True)
+order_summaries_schema = OrderSummarySchema(many=True)
+archived_orders_schema = ArchivedOrderSchema(many=True)
+
+user_schema = UserSchema(exclude=("orders",))
+users_schema = UserSchema(many=True, exclude=("orders",))
@@ -0,0 +1,233 @@
+"""
+Product name search for GET /products/search.
+
+On MySQL the FULLTEXT index on products.product_name answers the query.
+Elsewhere (or with SEARCH_BACKEND = "memory") an in-process inverted
+index does: the product routes update it on every write, and it picks up
+writes made by other workers every SEARCH_REFRESH seconds, from the
+products changed (ix_products_updated_at) and deleted (product_deletions)
+since it last looked. It is built once per worker, on the first search.
+
+Every search term must match the start of a word in the name, so
+"red sho" finds "Red Shoes" and "Shoe rack, red".
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, text
+
+from models import db, Product, ProductDeletion
+
+TOKEN_RE = re.compile(r"\w+")
+# Shorter terms only match whole words, a 1-letter prefix matches too much
+MIN_PREFIX = 2
+# innodb_ft_min_token_size
+FULLTEXT_MIN_TOKEN = 3
+MATCH = text("MATCH (products.product_name) AGAINST (:q IN BOOLEAN MODE)")
+# Defaults for SEARCH_BACKEND ("auto", "fulltext", "memory") and SEARCH_REFRESH
+DEFAULT_BACKEND = "auto"
+DEFAULT_REFRESH = 10  # seconds
+# How far before a watermark a refresh starts reading again
+OVERLAP = timedelta(seconds=1)
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(value.lower())
+
+
+class InvertedIndex:
+    """token -> product ids, plus a sorted vocabulary for prefix lookups."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.vocabulary = []
+        self.documents = {}  # id -> (tokens, price)
+
+    def load(self, rows):
+        """Bulk-build from (id, product_name, price) rows."""
+        with self.lock:
+            for product_id, name, price in rows:
+                tokens = set(tokenize(name))
+                for token in tokens:
+                    self.postings.setdefault(token, set()).add(product_id)
+                self.documents[product_id] = (tokens, price)
+            self.vocabulary = sorted(self.postings)
+
+    def add(self, product_id, name, price):
+        with self.lock:
+            self._remove(product_id)
+            tokens = set(tokenize(name))
+            for token in tokens:
+                ids = self.postings.get(token)
+                if ids is None:
+                    ids = self.postings[token] = set()
+                    bisect.insort(self.vocabulary, token)
+                ids.add(product_id)
+            self.documents[product_id] = (tokens, price)
+
+    def remove(self, product_id):
+        with self.lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        document = self.documents.pop(product_id, None)
+        if document is None:
+            return
+        for token in document[0]:
+            ids = self.postings[token]
+            ids.discard(product_id)
+            if not ids:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def matching(self, term):
+        """Ids of products with a word starting with `term`."""
+        if len(term) < MIN_PREFIX:
+            return self.postings.get(term, set())
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + "\U0010ffff", start)
+        if end - start == 1:
+            return self.postings[self.vocabulary[start]]
+        ids = set()
+        for token in self.vocabulary[start:end]:
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, terms, min_price=None, max_price=None, after=0, limit=50):
+        """The first `limit` matching ids greater than `after`, ascending."""
+        with self.lock:
+            # Intersect starting from the rarest term
+            matches = sorted((self.matching(term) for term in terms), key=len)
+            ids = matches[0].intersection(*matches[1:])
+
+            documents = self.documents
+            hits = (
+                product_id
+                for product_id in ids
+                if product_id > after
+                and (min_price is None or documents[product_id][1] >= min_price)
+                and (max_price is None or documents[product_id][1] <= max_price)
+            )
+            return heapq.nsmallest(limit, hits)
+
+
+class ProductSearch:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.watermark = None  # newest updated_at seen in the database
+        self.deleted_watermark = None  # newest product_deletions.deleted_at seen
+        self.checked_at = 0.0
+
+    def init_app(self, app):
+        app.config.setdefault("SEARCH_BACKEND", DEFAULT_BACKEND)
+        app.config.setdefault("SEARCH_REFRESH", DEFAULT_REFRESH)
+        # Built from this app's database on the first search
+        self.index = None
+
+    def uses_fulltext(self):
+        backend = current_app.config.get("SEARCH_BACKEND", DEFAULT_BACKEND)
+        if backend == "auto":
+            return db.engine.dialect.name == "mysql"
+        return backend == "fulltext"
+
+    def statement(self, terms, min_price=None, max_price=None, after=0, limit=50):
+        """
+        SELECT for one page of matches ordered by id: up to `limit` rows
+        after the cursor (callers pass limit + 1 to detect a next page).
+        """
+        if self.uses_fulltext():
+            stmt = select(Product).where(Product.id > after)
+            # Boolean mode: every term required, each as a word prefix
+            indexed = [term for term in terms if len(term) >= FULLTEXT_MIN_TOKEN]
+            if indexed:
+                against = " ".join(f"+{term}*" for term in indexed)
+                stmt = stmt.where(MATCH.bindparams(q=against))
+            # InnoDB doesn't index shorter words, match those with LIKE
+            for term in terms:
+                if len(term) < FULLTEXT_MIN_TOKEN:
+                    stmt = stmt.where(
+                        Product.product_name.startswith(term, autoescape=True)
+                        | Product.product_name.contains(f" {term}", autoescape=True)
+                    )
+            if min_price is not None:
+                stmt = stmt.where(Product.price >= min_price)
+            if max_price is not None:
+                stmt = stmt.where(Product.price <= max_price)
+            return stmt.order_by(Product.id)
+
+        ids = self._memory_index().search(terms, min_price, max_price, after, limit)
+        return select(Product).where(Product.id.in_(ids)).order_by(Product.id)
+
+    def index_product(self, product):
+        """Call after committing a created or updated product."""
+        if self.index is not None:
+            self.index.add(product.id, product.product_name, product.price)
+
+    def record_delete(self, product_id):
+        """Call before committing a product delete, so other workers see it."""
+        if not self.uses_fulltext():
+            db.session.add(ProductDeletion(product_id=product_id))
+
+    def remove_product(self, product_id):
+        """Call after committing a product delete."""
+        if self.index is not None:
+            self.index.remove(product_id)
+
+    def _memory_index(self):
+        refresh = current_app.config.get("SEARCH_REFRESH", DEFAULT_REFRESH)
+        if self.index is None or time.monotonic() - self.checked_at > refresh:
+            with self.lock:
+                if self.index is None:
+                    self._build()
+                elif time.monotonic() - self.checked_at > refresh:
+                    self._refresh()
+        return self.index
+
+    def _build(self):
+        index = InvertedIndex()
+        # Read the watermarks first so nothing written during the load is missed
+        watermark = db.session.execute(select(func.max(Product.updated_at))).scalar()
+        deleted_watermark = db.session.execute(
+            select(func.max(ProductDeletion.deleted_at))
+        ).scalar()
+        index.load(
+            db.session.execute(select(Product.id, Product.product_name, Product.price))
+        )
+        self.index = index
+        self.watermark = watermark
+        self.deleted_watermark = deleted_watermark
+        self.checked_at = time.monotonic()
+
+    def _refresh(self):
+        # Writes made by other workers since the last check, both through
+        # an index. The timestamps have second precision (and on SQLite
+        # "12:00:05" sorts before the bound "12:00:05.000000"), so the
+        # last second is read again. Deletes first: SQLite may give a
+        # deleted id to a new product.
+        stmt = select(ProductDeletion.product_id, ProductDeletion.deleted_at)
+        if self.deleted_watermark is not None:
+            since = self.deleted_watermark - OVERLAP
+            stmt = stmt.where(ProductDeletion.deleted_at >= since)
+        for product_id, deleted_at in db.session.execute(stmt):
+            self.index.remove(product_id)
+            if self.deleted_watermark is None or deleted_at > self.deleted_watermark:
+                self.deleted_watermark = deleted_at
+
+        stmt = select(Product.id, Product.product_name, Product.price, Product.updated_at)
+        if self.watermark is not None:
+            stmt = stmt.where(Product.updated_at >= self.watermark - OVERLAP)
+        for product_id, name, price, updated_at in db.session.execute(stmt):
+            self.index.add(product_id, name, price)
+            if self.watermark is None or (updated_at and updated_at > self.watermark):
+                self.watermark = updated_at
+        self.checked_at = time.monotonic()
+
+
+product_search = ProductSearch()
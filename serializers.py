@@ -0,0 +1,210 @@
+from functools import lru_cache
+
+from flask import current_app, request
+from marshmallow import fields
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import aliased
+
+from models import db
+
+# Parent ids per IN (...) when loading nested collections
+IN_BATCH_SIZE = 1000
+
+
+class UnsupportedSchema(TypeError):
+    """The schema uses a field the fast path can't reproduce exactly."""
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+# Same conversions marshmallow applies when dumping these field types
+CONVERTERS = (
+    (fields.DateTime, _isoformat),
+    (fields.Integer, int),
+    (fields.Float, float),
+    (fields.String, str),
+    (fields.Boolean, bool),
+)
+
+
+def _converter(field):
+    if isinstance(field, fields.DateTime) and field.format not in (None, "iso"):
+        raise UnsupportedSchema(f"DateTime format {field.format!r}")
+    if isinstance(field, fields.Number) and field.as_string:
+        raise UnsupportedSchema("Number fields dumped as strings")
+    for field_type, convert in CONVERTERS:
+        if isinstance(field, field_type):
+            return convert
+    raise UnsupportedSchema(f"{type(field).__name__} fields")
+
+
+class CompiledSchema:
+    """
+    Dumps the same dicts as `schema.dump()` straight from Core row tuples.
+
+    Columns and many-to-one Nested fields (user, product) are fetched with
+    one column-only SELECT using outer joins; each nested collection
+    (order_products) costs one more SELECT ... WHERE fk IN (...) per batch
+    of parents. No ORM instances are created.
+    """
+
+    def __init__(self, schema, model=None):
+        self.model = model or schema.opts.model
+        mapper = inspect(self.model)
+        self.pk = [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+        self.scalars = []  # (data key, attribute, converter)
+        self.parents = []  # (data key, relationship, CompiledSchema) many-to-one
+        self.children = []  # (data key, relationship, CompiledSchema) collections
+
+        for name, field in schema.dump_fields.items():
+            key = field.data_key or name
+            attr = field.attribute or name
+            if isinstance(field, fields.Nested):
+                relationship = mapper.relationships.get(attr)
+                if relationship is None:
+                    raise UnsupportedSchema(f"Nested field {name} isn't a relationship")
+                child = compile_schema(field.schema, relationship.mapper.class_)
+                if relationship.uselist:
+                    if len(relationship.local_columns) != 1:
+                        raise UnsupportedSchema("Collections keyed on several columns")
+                    self.children.append((key, relationship, child))
+                else:
+                    self.parents.append((key, relationship, child))
+            elif attr in mapper.column_attrs:
+                self.scalars.append((key, attr, _converter(field)))
+            else:
+                raise UnsupportedSchema(f"Field {name} isn't a column")
+
+    def columns(self, entity):
+        """Column expressions and outer joins needed to build one object."""
+        cols = [getattr(entity, attr) for attr in self.pk]
+        cols += [getattr(entity, attr) for _, attr, _ in self.scalars]
+        joins = []
+        for _, relationship, child in self.parents:
+            target = aliased(relationship.mapper.class_)
+            joins.append(getattr(entity, relationship.key).of_type(target))
+            child_cols, child_joins = child.columns(target)
+            cols += child_cols
+            joins += child_joins
+        return cols, joins
+
+    def build(self, row, i, pending):
+        """Build the object starting at row[i]; returns (pk, obj, next i)."""
+        pk = tuple(row[i : i + len(self.pk)])
+        i += len(self.pk)
+
+        obj = {}
+        for key, _, convert in self.scalars:
+            value = row[i]
+            obj[key] = None if value is None else convert(value)
+            i += 1
+
+        for key, _, child in self.parents:
+            _, obj[key], i = child.build(row, i, pending)
+
+        if pk[0] is None:
+            # Outer-joined parent that doesn't exist, marshmallow dumps None
+            return pk, None, i
+        if self.children:
+            pending.append((self, pk, obj))
+        return pk, obj, i
+
+    def query(self, session, where=(), order_by=None, limit=None, lead=None):
+        """
+        Return [(pk, obj)] for the rows matching `where`. When `lead` is
+        given its value is returned instead of the pk, used to group
+        collection rows by their foreign key.
+        """
+        cols, joins = self.columns(self.model)
+        if lead is not None:
+            cols = [lead] + cols
+
+        stmt = select(*cols).select_from(self.model)
+        for join in joins:
+            stmt = stmt.outerjoin(join)
+        stmt = stmt.where(*where)
+        if order_by is None:
+            order_by = [getattr(self.model, attr) for attr in self.pk]
+        stmt = stmt.order_by(*order_by).limit(limit)
+
+        pending = []
+        results = []
+        for row in session.execute(stmt):
+            start = 1 if lead is not None else 0
+            pk, obj, _ = self.build(row, start, pending)
+            results.append((row[0] if lead is not None else pk, obj))
+
+        _load_children(session, pending)
+        return results
+
+    def dump(self, session, where=(), order_by=None, limit=None):
+        return [obj for _, obj in self.query(session, where, order_by, limit)]
+
+
+def _load_children(session, pending):
+    """Fill the nested collections of every object built in one query."""
+    by_schema = {}
+    for compiled, pk, obj in pending:
+        by_schema.setdefault(compiled, []).append((pk, obj))
+
+    for compiled, nodes in by_schema.items():
+        for key, relationship, child in compiled.children:
+            (fk,) = relationship.remote_side
+            parents = {pk[0]: obj for pk, obj in nodes}
+            for obj in parents.values():
+                obj[key] = []
+
+            order_by = [fk] + [
+                getattr(child.model, attr) for attr in child.pk
+            ]
+            if relationship.order_by:
+                order_by = [fk, *relationship.order_by]
+
+            ids = list(parents)
+            for start in range(0, len(ids), IN_BATCH_SIZE):
+                batch = ids[start : start + IN_BATCH_SIZE]
+                rows = child.query(
+                    session, where=[fk.in_(batch)], order_by=order_by, lead=fk
+                )
+                for parent_id, obj in rows:
+                    parents[parent_id][key].append(obj)
+
+
+# Bounded: ?fields= variants (fieldsets.py) add entries
+@lru_cache(maxsize=1024)
+def compile_schema(schema, model=None):
+    return CompiledSchema(schema, model)
+
+
+def fast_serializer(schema):
+    """
+    The compiled serializer for `schema` when the current request should
+    use it, otherwise None.
+
+    Routes opt in through the FAST_SERIALIZER_ENDPOINTS config
+    (e.g. {"orders.get_orders"}); ?serializer=fast or ?serializer=marshmallow
+    overrides it per request. Schemas the fast path can't reproduce
+    exactly always fall back to marshmallow.
+    """
+    choice = request.args.get("serializer")
+    if choice is None:
+        enabled = request.endpoint in current_app.config.get(
+            "FAST_SERIALIZER_ENDPOINTS", ()
+        )
+    else:
+        enabled = choice == "fast"
+    if not enabled:
+        return None
+
+    try:
+        return compile_schema(schema)
+    except UnsupportedSchema:
+        return None
+
+
+def dump_one(compiled, key, value):
+    """Dump the single row where `key == value`, or None."""
+    rows = compiled.dump(db.session, where=[key == value])
+    return rows[0] if rows else None